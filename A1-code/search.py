@@ -36,14 +36,26 @@
       search (using the init_search method) and resume the search after
       a goal is found (using searchOpen). See the implementation for details. 
 
+    C) function solve_many
+
+      solves a batch of problems in parallel, one search per problem,
+      using a pool of worker processes.
+
     '''
 import heapq
-from collections import deque
+import math
+from collections import OrderedDict, deque
+import multiprocessing
 import os
+import queue
+import time
 
 class StateSpace:
     '''Abstract class for defining State spaces for search routines'''
-    n = 0
+
+    #subclasses that also define __slots__ get compact instances without a
+    #per-instance __dict__; subclasses that don't are unaffected
+    __slots__ = ('action', 'gval', 'parent', 'index')
     
     def __init__(self, action, gval, parent):
         '''Problem specific state space objects must always include the data items
@@ -58,8 +70,8 @@ class StateSpace:
         self.action = action
         self.gval = gval
         self.parent = parent
-        self.index = StateSpace.n
-        StateSpace.n = StateSpace.n + 1
+        #numbered by the search engine as states are generated
+        self.index = 0
 
     def successors(self):
         '''This method when invoked on a state space object must return a
@@ -77,6 +89,13 @@ class StateSpace:
            if and only if obj1 and obj2 represent the same problem state.'''
         raise Exception("Must be overridden in subclass.")
 
+    def heuristic_key(self):
+        '''Return the key HeuristicCache stores the heuristic value of the
+           state under. It is hashable_state() unless a subclass's
+           hashable_state() treats as equal states that heuristics can
+           tell apart.'''
+        return self.hashable_state()
+
     def print_state(self):
         '''Print a representation of the state'''
         raise Exception("Must be overridden in subclass.")
@@ -112,14 +131,10 @@ _BEST_FIRST = 2
 _ASTAR = 3
 _UCS = 4
 _CUSTOM = 5
-
-#For best first and astar we use a priority queue. This requires
-#a comparison function for nodes. These constants indicate if we use
-#the gval, the hval or the sum of gval and hval in the comparison.
-_SUM_HG = 0
-_H = 1
-_G = 2
-_C = 3
+_IDASTAR = 6
+_BIDIRECTIONAL = 7
+_HDASTAR = 8
+_MHASTAR = 9
 
 #Cycle Checking. Either CC_NONE 'none' (no cycle checking), CC_PATH
 #'path' (path checking only) or CC_FULL 'full' (full cycle checking,
@@ -128,6 +143,23 @@ _CC_NONE = 0
 _CC_PATH = 1
 _CC_FULL = 2
 
+#OPEN set for the priority queue strategies. Either OPEN_LAZY 'lazy' (a
+#heap that may hold several nodes for the same state, stale ones are
+#skipped when extracted) or OPEN_INDEXED 'indexed' (a heap indexed by
+#hashable_state() that holds at most one node per state and supports
+#decrease-key and removal).
+_OPEN_LAZY = 0
+_OPEN_INDEXED = 1
+
+#Clocks a search's timebound can be measured with. Either 'cpu' (the
+#CPU time used by this process) or 'wall' (elapsed real time).
+_CLOCKS = {'cpu': time.process_time, 'wall': time.monotonic}
+
+#Reading a clock on every expansion is expensive, so a timebound is only
+#checked every so many expansions. That number is tuned as the search
+#runs so that checks are roughly this many seconds apart.
+_DEADLINE_TOLERANCE = 0.01
+
 #Zero Heuristic Function---for uninformed search don't include heur_fn
 #in call to search engine's search method, defaults heur_fn to the zero fn.
 def _zero_hfn(state):
@@ -138,60 +170,208 @@ def _fval_function(state):
   '''default fval function results in Best First Search'''  
   return state.hval 
 
+def _weighted_fval_function(weight):
+  '''fval function g + weight*h of weighted A*'''
+  return lambda sN: sN.gval + weight * sN.hval
+
 class SearchStats:
 
-    def __init__(self, n1, n2, n3, n4):
+    def __init__(self, n1, n2, n3, n4, expansions=0, search_time=0.0, peak_open=0, peak_closed=0,
+                 time_successors=0.0, time_heuristic=0.0, time_cycle_check=0.0, time_open=0.0,
+                 heur_cache_hits=0, heur_cache_misses=0):
         self.states_expanded = n1
         self.states_generated = n2
         self.states_pruned_cycles = n3      
         self.states_pruned_cost = n4     
+        #number of nodes whose successors were generated, and the (wall
+        #clock) time spent searching
+        self.expansions = expansions
+        self.search_time = search_time
+        self.expansions_per_second = expansions / search_time if search_time > 0 else 0.0
+        #largest sizes of OPEN and of the cycle check dictionary, and the
+        #time spent generating successors, evaluating the heuristic,
+        #hashing and cycle checking, and inserting into and extracting
+        #from OPEN (only recorded when the engine's profiling is on)
+        self.peak_open = peak_open
+        self.peak_closed = peak_closed
+        self.time_successors = time_successors
+        self.time_heuristic = time_heuristic
+        self.time_cycle_check = time_cycle_check
+        self.time_open = time_open
+        #heuristic values found in and missing from the heuristic cache
+        #(if the search uses one)
+        self.heur_cache_hits = heur_cache_hits
+        self.heur_cache_misses = heur_cache_misses
 
 class sNode:
     '''Object of this class form the nodes of the search space.  Each
     node consists of a search space object (determined by the problem
     definition) along with the h and g values (the g values is
     redundant as it is stored in the state, but we make a copy in the
-    node object for convenience), and the number of the node'''
+    node object for convenience), and the number of the node (assigned
+    by the search engine that created it)'''
     
-    n = 0
-    lt_type = _SUM_HG
-    
-    def __init__(self, state, hval, fval_function):
+    def __init__(self, state, hval, fval_function, index=0):
         self.state = state
         self.hval = hval
         self.gval = state.gval
-        self.index = sNode.n
+        self.index = index
         self.fval_function = fval_function
-        sNode.n = sNode.n + 1
-
-    def __lt__(self, other):
-        '''For astar and best first we use a priority queue for the
-           OPEN set. This queue stores search nodes waiting to be
-           expanded. Thus we need to define a node1 < node2 function
-           by defining the __lt__ function. Dependent on the type of
-           search this comparison function compares the h-value, the
-           g-value or the f-value of the nodes. Note for the f-value
-           we wish to break ties by letting node1 < node2 if they both
-           have identical f-values but if node1 has a GREATER g
-           value. This means that we expand nodes along deeper paths
-           first causing the search to proceed directly to the goal'''
-                
-        if sNode.lt_type == _SUM_HG:
-            if (self.gval+self.hval) == (other.gval+other.hval):
-                #break ties by greatest gval. 
-                return self.gval > other.gval
-            else: return ((self.gval+self.hval) < (other.gval+other.hval))
-        if sNode.lt_type == _G:
-            return self.gval < other.gval
-        if sNode.lt_type == _H:
-            return self.hval < other.hval    
-        if sNode.lt_type == _C:  
-            return self.fval_function(self) <  other.fval_function(other)          
-        
-        print('sNode class has invalid comparator setting!')
-        
-        #return default of lowest gval (generating UCS behavior)
-        return self.gval < other.gval
+
+#Priority functions for the priority queue strategies. For astar and
+#best first we use a priority queue for the OPEN set, ordered by the
+#g-value, the h-value or the f-value of the nodes depending on the type
+#of search. Each function returns a tuple ending with the node index so
+#that nodes with equal priority come off OPEN in the order they were
+#generated. Note for the f-value we break ties in favour of the node with
+#the GREATER g value, so that we expand nodes along deeper paths first
+#causing the search to proceed directly to the goal.
+def _priority_g(node):
+    return (node.gval, node.index)
+
+def _priority_h(node):
+    return (node.hval, node.index)
+
+def _priority_sum_hg(node):
+    #break ties in gval+hval by greatest gval
+    return (node.gval + node.hval, -node.gval, node.index)
+
+def _priority_custom(node):
+    return (node.fval_function(node), node.index)
+
+class IndexedHeap:
+    '''Binary heap of search nodes indexed by the hashable_state() of
+       the node's state. The heap holds at most one node per state:
+       pushing a node for a state that is already on the heap replaces
+       the old node if the new one reaches the state more cheaply
+       (decrease-key) and is otherwise dropped. Nodes can also be
+       removed by state key. The heap holds (priority(node), node)
+       entries.'''
+
+    def __init__(self, priority):
+        self.priority = priority
+        self.heap = []
+        self.keys = []
+        self.position = dict()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __iter__(self):
+        return (entry[1] for entry in self.heap)
+
+    def __contains__(self, key):
+        return key in self.position
+
+    def get(self, key):
+        '''Return the node on the heap for the state with this key (or None)'''
+        i = self.position.get(key)
+        return None if i is None else self.heap[i][1]
+
+    def push(self, node):
+        '''Insert node, or decrease the key of the node already on the
+           heap for the same state. Returns True if the heap changed.'''
+        key = node.state.hashable_state()
+        i = self.position.get(key)
+        if i is None:
+            self.heap.append((self.priority(node), node))
+            self.keys.append(key)
+            self.position[key] = len(self.heap) - 1
+            self._sift_up(len(self.heap) - 1)
+            return True
+        if node.gval >= self.heap[i][1].gval:
+            #already have a path to this state that is no more expensive
+            return False
+        self.heap[i] = (self.priority(node), node)
+        self._sift_up(i)
+        self._sift_down(self.position[key])
+        return True
+
+    def pop(self):
+        '''Remove and return the smallest node'''
+        node = self.heap[0][1]
+        self._delete(0)
+        return node
+
+    def remove(self, key):
+        '''Remove the node for the state with this key. Returns the
+           removed node (or None if the state is not on the heap).'''
+        i = self.position.get(key)
+        if i is None:
+            return None
+        node = self.heap[i][1]
+        self._delete(i)
+        return node
+
+    def rebuild(self, nodes):
+        '''Replace the contents of the heap by nodes (at most one per state),
+           recomputing their priorities, in O(n)'''
+        entries = [((self.priority(node), node), node.state.hashable_state()) for node in nodes]
+        #priorities are unique so heapify never compares the keys
+        heapq.heapify(entries)
+        self.heap = [entry for entry, key in entries]
+        self.keys = [key for entry, key in entries]
+        self.position = {key: i for i, key in enumerate(self.keys)}
+
+    def evict(self, count):
+        '''Remove and return the count nodes with the largest priority'''
+        heap, keys = self.heap, self.keys
+        worst = set(heapq.nlargest(count, range(len(heap)), key=heap.__getitem__))
+        evicted = [heap[i][1] for i in worst]
+        kept = [(heap[i], keys[i]) for i in range(len(heap)) if i not in worst]
+        #priorities are unique so heapify never compares the keys
+        heapq.heapify(kept)
+        self.heap = [entry for entry, key in kept]
+        self.keys = [key for entry, key in kept]
+        self.position = {key: i for i, key in enumerate(self.keys)}
+        return evicted
+
+    def _delete(self, i):
+        heap, keys = self.heap, self.keys
+        del self.position[keys[i]]
+        last = heap.pop()
+        last_key = keys.pop()
+        if i < len(heap):
+            heap[i] = last
+            keys[i] = last_key
+            self.position[last_key] = i
+            self._sift_up(i)
+            self._sift_down(self.position[last_key])
+
+    def _sift_up(self, i):
+        heap, keys, position = self.heap, self.keys, self.position
+        entry, key = heap[i], keys[i]
+        while i > 0:
+            parent = (i - 1) >> 1
+            if not entry < heap[parent]:
+                break
+            heap[i] = heap[parent]
+            keys[i] = keys[parent]
+            position[keys[i]] = i
+            i = parent
+        heap[i] = entry
+        keys[i] = key
+        position[key] = i
+
+    def _sift_down(self, i):
+        heap, keys, position = self.heap, self.keys, self.position
+        n = len(heap)
+        entry, key = heap[i], keys[i]
+        while True:
+            child = 2 * i + 1
+            if child >= n:
+                break
+            if child + 1 < n and heap[child + 1] < heap[child]:
+                child = child + 1
+            if not heap[child] < entry:
+                break
+            heap[i] = heap[child]
+            keys[i] = keys[child]
+            position[keys[i]] = i
+            i = child
+        heap[i] = entry
+        keys[i] = key
+        position[key] = i
 
 class Open:
     '''Open objects hold the search frontier---the set of unexpanded
@@ -200,7 +380,8 @@ class Open:
        functions to operate as needed by the particular search
        strategy'''
     
-    def __init__(self, search_strategy):
+    def __init__(self, search_strategy, open_mode=_OPEN_LAZY):
+        self.priority = None
         if search_strategy == _DEPTH_FIRST:
             #use stack for OPEN set (last in---most recent successor added---is first out)
             self.open = []
@@ -213,54 +394,132 @@ class Open:
             self.extract = self.open.popleft
         elif search_strategy == _UCS:
             #use priority queue for OPEN (first out is node with lowest gval)
-            self.open = []
-            #set node less than function to compare gvals only
-            sNode.lt_type = _G
-            self.insert = lambda node: heapq.heappush(self.open, node)
-            self.extract = lambda: heapq.heappop(self.open)            
+            self.priority = _priority_g
         elif search_strategy == _BEST_FIRST:
             #use priority queue for OPEN (first out is node with lowest hval)
-            self.open = []
-            #set node less than function to compare hvals only
-            sNode.lt_type = _H
-            self.insert = lambda node: heapq.heappush(self.open, node)
-            self.extract = lambda: heapq.heappop(self.open)
+            self.priority = _priority_h
         elif search_strategy == _ASTAR:
             #use priority queue for OPEN (first out is node with lowest fval = gval+hval)
-            self.open = []
-            #set node less than function to compare sums of hval and gval
-            sNode.lt_type = _SUM_HG
-            self.insert = lambda node: heapq.heappush(self.open, node)
-            self.extract = lambda: heapq.heappop(self.open) 
+            self.priority = _priority_sum_hg
         elif search_strategy == _CUSTOM:
             #use priority queue for OPEN (first out is node with lowest fval)
+            self.priority = _priority_custom
+
+        #The priority queue holds (priority, node) entries. The priority
+        #is computed once when the node is inserted, so heap operations
+        #compare plain tuples instead of calling sNode.__lt__.
+        if self.priority is None:
+            pass
+        elif open_mode == _OPEN_INDEXED:
+            #keep one node per state on OPEN, replacing it when a cheaper
+            #path to the state is found
+            self.open = IndexedHeap(self.priority)
+            self.insert = self.open.push
+            self.extract = self.open.pop
+        else:
             self.open = []
-            #set node less than function to compare sums of fval    
-            sNode.lt_type = _C
-            self.insert = lambda node: heapq.heappush(self.open, node)
-            self.extract = lambda: heapq.heappop(self.open)          
+            priority = self.priority
+            heap = self.open
+            self.insert = lambda node: heapq.heappush(heap, (priority(node), node))
+            self.extract = lambda: heapq.heappop(heap)[1]
 
     def empty(self): return not self.open
 
+    def nodes(self):
+        '''Return the nodes currently on OPEN (in no particular order)'''
+        if self.priority is None or isinstance(self.open, IndexedHeap):
+            return list(self.open)
+        return [entry[1] for entry in self.open]
+
+    def rebuild(self, nodes):
+        '''Replace the nodes on a priority queue OPEN by nodes, recomputing
+           their priorities. The heap is rebuilt in place in O(n).'''
+        if isinstance(self.open, IndexedHeap):
+            self.open.rebuild(nodes)
+        else:
+            #insert and extract refer to this list, so keep the same object
+            self.open[:] = [(self.priority(node), node) for node in nodes]
+            heapq.heapify(self.open)
+
     def print_open(self):
         print("{", end="")
-        if len(self.open) == 1: 
-            print("   <S{}:{}:{}, g={}, h={}, f=g+h={}>".format(self.open[0].state.index, self.open[0].state.action, self.open[0].state.hashable_state(), self.open[0].gval, self.open[0].hval, self.open[0].gval+self.open[0].hval), end="")
-        else:
-            for nd in self.open:
-                print("   <S{}:{}:{}, g={}, h={}, f=g+h={}>".format(nd.state.index, nd.state.action, nd.state.hashable_state(), nd.gval, nd.hval, nd.gval+nd.hval), end="")
+        for nd in self.nodes():
+            print("   <S{}:{}:{}, g={}, h={}, f=g+h={}>".format(nd.state.index, nd.state.action, nd.state.hashable_state(), nd.gval, nd.hval, nd.gval+nd.hval), end="")
         print("}")
 
+class HeuristicCache:
+    '''A heuristic function that remembers the values it computed for the
+       most recently used max_size states (keyed by their heuristic_key()),
+       so states reached again, in the same search or in another search
+       given the same HeuristicCache, are not evaluated again.'''
+
+    def __init__(self, heur_fn, max_size):
+        self.heur_fn = heur_fn
+        self.max_size = max_size
+        self.values = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, state):
+        key = state.heuristic_key()
+        values = self.values
+        hval = values.get(key)
+        if hval is not None:
+            self.hits = self.hits + 1
+            values.move_to_end(key)
+            return hval
+        self.misses = self.misses + 1
+        hval = self.heur_fn(state)
+        values[key] = hval
+        if len(values) > self.max_size:
+            #evict the least recently used value
+            values.popitem(last=False)
+        return hval
+
 class SearchEngine:
-    def __init__(self, strategy = 'depth_first', cc_level = 'default'):
-        self.set_strategy(strategy, cc_level)
+    def __init__(self, strategy = 'depth_first', cc_level = 'default', open_mode = 'default', tt_size = 0, max_nodes = None, workers = None):
+        self.set_strategy(strategy, cc_level, open_mode, tt_size, max_nodes, workers)
         self.trace = 0
+        self.profile = False
+        self.monitor = None
 
     def initStats(self):
-        sNode.n = 0
-        StateSpace.n = 1    #initial state already generated on call so search
+        #all per-search state lives on the engine (not on the sNode or
+        #StateSpace classes) so that independent engines can search
+        #concurrently
+        self.node_count = 0
+        self.state_count = 1    #initial state already generated on call so search
         self.cycle_check_pruned = 0
         self.cost_bound_pruned = 0
+        self.nodes_evicted = 0
+        self.expansions = 0
+        self.search_time = 0.0
+        #when the search now running started (None between searches)
+        self.search_started = None
+        self.peak_open = 0
+        self.peak_closed = 0
+        self.time_successors = 0.0
+        self.time_heuristic = 0.0
+        self.time_cycle_check = 0.0
+        self.time_open = 0.0
+        self.heur_cache = None
+        self.heur_cache_hits = 0
+        self.heur_cache_misses = 0
+
+    def get_stats(self):
+        '''Return a SearchStats object with the statistics of the current search so far'''
+        if self.heur_cache is not None:
+            #the cache may have been used before this search started
+            self.heur_cache_hits = self.heur_cache.hits - self.heur_cache_hits_before
+            self.heur_cache_misses = self.heur_cache.misses - self.heur_cache_misses_before
+        search_time = self.search_time
+        if self.search_started is not None:
+            #called during a search (e.g., by the monitor)
+            search_time = search_time + time.perf_counter() - self.search_started
+        return SearchStats(self.node_count, self.state_count, self.cycle_check_pruned, self.cost_bound_pruned,
+                           self.expansions, search_time, self.peak_open, self.peak_closed,
+                           self.time_successors, self.time_heuristic, self.time_cycle_check, self.time_open,
+                           self.heur_cache_hits, self.heur_cache_misses)
 
     def trace_on(self, level = 1):
         '''For debugging, set tracking level 1 or 2'''
@@ -270,17 +529,41 @@ class SearchEngine:
         '''Turn off tracing'''
         self.trace = 0
 
-    def set_strategy(self, s, cc = 'default'):
-        if not s in ['depth_first', 'breadth_first', 'ucs', 'best_first', 'astar', 'custom']:
+    def profile_on(self):
+        '''Record peak OPEN and cycle check dictionary sizes and a breakdown
+           of the search time in the search statistics (this slows the
+           search down a little)'''
+        self.profile = True
+
+    def profile_off(self):
+        '''Turn off profiling'''
+        self.profile = False
+
+    def set_monitor(self, callback, every = 1000):
+        '''Call callback(stats) with the statistics of the search so far
+           (a SearchStats object) every time another "every" nodes have been
+           expanded. Pass None as callback to remove the monitor.'''
+        self.monitor = callback
+        self.monitor_every = every
+
+    def set_strategy(self, s, cc = 'default', open_mode = 'default', tt_size = 0, max_nodes = None, workers = None):
+        if not s in ['depth_first', 'breadth_first', 'ucs', 'best_first', 'astar', 'custom', 'idastar', 'bidirectional', 'hdastar', 'mhastar']:
             print('Unknown search strategy specified:', s)
-            print("Must be one of 'depth_first', 'ucs', 'breadth_first', 'best_first', 'custom' or 'astar'")
+            print("Must be one of 'depth_first', 'ucs', 'breadth_first', 'best_first', 'custom', 'astar', 'idastar', 'bidirectional', 'hdastar' or 'mhastar'")
         elif not cc in ['default', 'none', 'path', 'full']:
             print('Unknown cycle check level', cc)
             print( "Must be one of ['default', 'none', 'path', 'full']")
+        elif not open_mode in ['default', 'lazy', 'indexed']:
+            print('Unknown OPEN mode', open_mode)
+            print( "Must be one of ['default', 'lazy', 'indexed']")
+        elif open_mode == 'indexed' and s in ['depth_first', 'breadth_first', 'idastar', 'bidirectional', 'hdastar', 'mhastar']:
+            print("Indexed OPEN is only available for the 'ucs', 'best_first', 'custom' and 'astar' strategies")
+        elif max_nodes and not s in ['astar', 'custom']:
+            print("A node bound is only available for the 'custom' and 'astar' strategies")
 
         else:
             if cc == 'default' :
-                if s == 'depth_first' :
+                if s == 'depth_first' or s == 'idastar' :
                     self.cycle_check = _CC_PATH
                 else:
                     self.cycle_check = _CC_FULL
@@ -294,6 +577,23 @@ class SearchEngine:
             elif s == 'best_first'   : self.strategy = _BEST_FIRST
             elif s == 'astar'        : self.strategy = _ASTAR       
             elif s == 'custom' : self.strategy = _CUSTOM             
+            elif s == 'idastar'      : self.strategy = _IDASTAR
+            elif s == 'bidirectional': self.strategy = _BIDIRECTIONAL
+            elif s == 'hdastar'      : self.strategy = _HDASTAR
+            elif s == 'mhastar'      : self.strategy = _MHASTAR
+
+            if open_mode == 'indexed': self.open_mode = _OPEN_INDEXED
+            else: self.open_mode = _OPEN_LAZY
+
+            #size of the transposition table used by idastar (0 for none)
+            self.tt_size = tt_size
+
+            #bound on the number of nodes stored by astar and custom (None
+            #for unbounded), see _evict
+            self.max_nodes = max_nodes
+
+            #number of worker processes used by hdastar (None for one per CPU)
+            self.workers = workers
 
     def get_strategy(self):
         if   self.strategy == _DEPTH_FIRST    : rval = 'depth_first'
@@ -302,6 +602,10 @@ class SearchEngine:
         elif self.strategy == _UCS          : rval = 'ucs' 
         elif self.strategy == _ASTAR          : rval = 'astar'      
         elif self.strategy == _CUSTOM          : rval = 'custom'   
+        elif self.strategy == _IDASTAR         : rval = 'idastar'
+        elif self.strategy == _BIDIRECTIONAL   : rval = 'bidirectional'
+        elif self.strategy == _HDASTAR         : rval = 'hdastar'
+        elif self.strategy == _MHASTAR         : rval = 'mhastar'
   
         rval = rval + ' with '
 
@@ -309,9 +613,14 @@ class SearchEngine:
         elif self.cycle_check == _CC_PATH : rval = rval + 'path checking'
         elif self.cycle_check == _CC_FULL : rval = rval + 'full cycle checking'
 
+        if self.open_mode == _OPEN_INDEXED : rval = rval + ' (indexed OPEN)'
+        if self.strategy == _IDASTAR and self.tt_size : rval = rval + ' and a transposition table of {} states'.format(self.tt_size)
+        if self.max_nodes : rval = rval + ' bounded to {} nodes'.format(self.max_nodes)
+
         return rval
 
-    def init_search(self, initState, goal_fn, heur_fn=_zero_hfn, fval_function=_fval_function):
+    def init_search(self, initState, goal_fn, heur_fn=_zero_hfn, fval_function=_fval_function, heur_cache_size=0,
+                    heur_batch_fn=None):
         """
         Get ready to search. Call search on this object to run the search.
 
@@ -319,6 +628,14 @@ class SearchEngine:
         @param goal_fn: the goal function for the puzzle
         @param heur_fn: the heuristic function to use (only relevant for search strategies that use heuristics)
         @param fval_fn: the f-value function (only relevant for custom search strategy)
+        @param heur_cache_size: if positive, cache the heuristic values of up to this many states
+                                (heur_fn can also be a HeuristicCache shared with other searches)
+        @param heur_batch_fn: a heuristic function that takes a list of states and returns a sequence
+                              (e.g., a NumPy array) of their values. If given, the strategies that
+                              search from OPEN (and anytime_search) evaluate all the successors of a
+                              node kept by cycle checking with one call instead of calling heur_fn on
+                              each of them. 'idastar', 'bidirectional', 'hdastar' and 'mhastar' only
+                              use heur_fn (or, for 'mhastar', the heur_fns of init_multi_heuristic_search).
         """
         #Perform full cycle checking as follows
         #a. check state before inserting into OPEN. If we had already reached
@@ -329,7 +646,14 @@ class SearchEngine:
         #   and if we have already expanded that state via a cheaper path
         #   we don't expand it. If we had expanded the state via a more
         #   expensive path, we re-expand it.
-        
+
+        if self.strategy == _BIDIRECTIONAL:
+            print("The 'bidirectional' strategy is set up with init_bidirectional_search")
+            return
+        if self.strategy == _MHASTAR:
+            print("The 'mhastar' strategy is set up with init_multi_heuristic_search")
+            return
+
         self.initStats()
 
         #BEGIN TRACING
@@ -338,27 +662,193 @@ class SearchEngine:
             print("   TRACE: Initial State:", end="")
             initState.print_state()
         #END 
-        self.open = Open(self.strategy)
+        if heur_cache_size > 0 and not isinstance(heur_fn, HeuristicCache):
+            heur_fn = HeuristicCache(heur_fn, heur_cache_size)
+        if isinstance(heur_fn, HeuristicCache):
+            self.heur_cache = heur_fn
+            self.heur_cache_hits_before = heur_fn.hits
+            self.heur_cache_misses_before = heur_fn.misses
+        self.fval_function = fval_function
+        self.goal_fn = goal_fn
+        self.heur_fn = heur_fn
+        self.heur_batch_fn = heur_batch_fn
+
+        if self.strategy == _IDASTAR:
+            #iterative deepening A* keeps no OPEN set, just the initial
+            #state and the stack of the current depth first iteration
+            self.init_state = initState
+            self.ida_stack = None
+            return
+
+        if self.strategy == _HDASTAR:
+            #the OPEN sets live in the worker processes of each search
+            self.init_state = initState
+            self.hda_found = set()
+            return
+
+        #memory bounded search evicts nodes from OPEN, which needs the
+        #indexed OPEN
+        self.open = Open(self.strategy, _OPEN_INDEXED if self.max_nodes else self.open_mode)
 
-        node = sNode(initState, heur_fn(initState), fval_function)      
+        hval = heur_fn(initState) if heur_batch_fn is None else heur_batch_fn([initState])[0]
+        node = sNode(initState, hval, fval_function, self.node_count)
+        self.node_count = self.node_count + 1
 
         #the cycle check dictionary stores the cheapest path (g-val) found
-        #so far to a state. 
+        #so far to a state. It is keyed by hashable_state() itself, so
+        #states whose keys hash alike are still told apart by the
+        #dictionary's equality check (a bare hash() value as key would
+        #silently merge them).
         if self.cycle_check == _CC_FULL:
             self.cc_dictionary = dict() 
             self.cc_dictionary[initState.hashable_state()] = initState.gval
+
+        #path checking for depth first search keeps the states on the path
+        #to the node being expanded (and their hashable states) as a stack
+        #that is pushed as the search descends and popped as it backtracks,
+        #so checking a successor against its path is a single set lookup.
+        #Other strategies walk the successor's parent chain instead.
+        self.path_states = None
+        if self.cycle_check == _CC_PATH and self.strategy == _DEPTH_FIRST:
+            self.path_states = []
+            self.path_hashes = []
+            self.path_set = set()
         
         self.open.insert(node)
-        self.fval_function = fval_function
-        self.goal_fn = goal_fn
-        self.heur_fn = heur_fn
 
-    def search(self, timebound=None, costbound=None):
+    def init_bidirectional_search(self, initState, goal_states, meet_key_fn, join_fn):
+        """
+        Get ready for a bidirectional search (the 'bidirectional' strategy).
+        Call search on this object to run the search.
+
+        A forward uniform cost search from initState and a backward one
+        from goal_states run alternately (always expanding the side with
+        the smaller frontier), until they meet. The states of the backward
+        search are problem specific: their successors() must return their
+        predecessors, i.e., states from which the state can be reached by
+        a single action, with gval the cost of the path from the state to
+        a goal, and the action of each predecessor must be the forward
+        action that leads from it to the state.
+
+        Every state generated on one side is checked against the states of
+        the other side that have the same meet_key_fn(state). The search
+        stops with the cheapest solution found once no cheaper one can
+        remain (the smallest gvals on the two frontiers sum to at least
+        its cost).
+
+        @param initState: the state of the puzzle to start the forward search from.
+        @param goal_states: the states to start the backward search from.
+        @param meet_key_fn: maps a forward or backward state to the key used to find the states of the other side it might meet.
+        @param join_fn: join_fn(forward_state, backward_state) returns the goal state reached by following the backward state's actions from the forward state (with its path through the forward state), or None if the two states do not meet.
+        """
+        if self.strategy != _BIDIRECTIONAL:
+            print("init_bidirectional_search requires the 'bidirectional' strategy")
+            return
+
+        self.initStats()
+        self.state_count = len(goal_states) + 1
+
+        #BEGIN TRACING
+        if self.trace:
+            print("   TRACE: Search Strategy: ", self.get_strategy())
+            print("   TRACE: Initial State:", end="")
+            initState.print_state()
+        #END
+
+        self.meet_key_fn = meet_key_fn
+        self.join_fn = join_fn
+        #per direction (0 forward, 1 backward): a priority queue of (gval,
+        #number, state), the cheapest gval found for each state, and the
+        #states generated indexed by their meet key
+        self.bd_open = ([], [])
+        self.bd_gvals = (dict(), dict())
+        self.bd_meet = (dict(), dict())
+        self.bd_joined = set()
+        for direction, states in ((0, [initState]), (1, goal_states)):
+            for state in states:
+                self._bidirectionalAdd(direction, state, state.hashable_state())
+
+    def init_multi_heuristic_search(self, initState, goal_fn, heur_fns, weight=1.0, anchor_weight=2.0,
+                                    schedule='round_robin'):
+        """
+        Get ready for a multi-heuristic A* search (the 'mhastar' strategy).
+        Call search on this object to run the search.
+
+        Shared multi-heuristic A* (SMHA*) keeps an OPEN queue per heuristic
+        of heur_fns, ordered by g + weight*h for that heuristic, and one
+        gval per state shared by all the queues. The first heuristic (the
+        anchor) must be admissible, the others can be anything. Each step
+        expands the top of one of the other queues, picked by schedule, as
+        long as its key is at most anchor_weight times the key of the top
+        of the anchor queue, and the top of the anchor queue otherwise. A
+        state is expanded at most once by the anchor and at most once by
+        the other queues. The solution costs at most weight*anchor_weight
+        times the optimal cost (self.mha_bound).
+
+        @param initState: the state of the puzzle to start the search from.
+        @param goal_fn: the goal function for the puzzle.
+        @param heur_fns: the heuristic functions, the admissible anchor first.
+        @param weight: the weight of the heuristic values in the keys of the queues (at least 1).
+        @param anchor_weight: how much larger than the anchor's the key of another queue can be for that queue to be expanded (at least 1).
+        @param schedule: 'round_robin' to take turns between the other queues, or 'bandit' to
+                         prefer the queues whose expansions keep lowering their heuristic (UCB1).
+        """
+        if self.strategy != _MHASTAR:
+            print("init_multi_heuristic_search requires the 'mhastar' strategy")
+            return
+        if not schedule in ['round_robin', 'bandit']:
+            print('Unknown schedule', schedule)
+            print("Must be one of ['round_robin', 'bandit']")
+            return
+
+        self.initStats()
+
+        #BEGIN TRACING
+        if self.trace:
+            print("   TRACE: Search Strategy: ", self.get_strategy())
+            print("   TRACE: Initial State:", end="")
+            initState.print_state()
+        #END
+
+        self.goal_fn = goal_fn
+        self.heur_fns = heur_fns
+        self.mha_weight = weight
+        self.mha_anchor_weight = anchor_weight
+        self.mha_bound = weight * anchor_weight
+        self.mha_schedule = schedule
+        #per heuristic a priority queue of (key, number, state, hashable
+        #state); the cheapest gval found for each state and its heuristic
+        #values; the gval each state was last expanded with, and the states
+        #expanded by the anchor and by the other queues
+        self.mha_open = [[] for heur_fn in heur_fns]
+        self.cc_dictionary = dict()
+        self.mha_hvals = dict()
+        self.mha_expanded = dict()
+        self.mha_closed_anchor = set()
+        self.mha_closed = set()
+        #the cheapest goal state generated so far
+        self.mha_goal = initState if goal_fn(initState) else None
+        #for the bandit schedule, per queue: the number of times it was
+        #picked, the number of those that lowered its heuristic, and the
+        #lowest value of its heuristic generated so far
+        self.mha_turn = 0
+        self.mha_plays = [0] * len(heur_fns)
+        self.mha_wins = [0] * len(heur_fns)
+        self.mha_best_hval = [float('inf')] * len(heur_fns)
+
+        hash_state = initState.hashable_state()
+        self.cc_dictionary[hash_state] = initState.gval
+        self._multiHeuristicAdd(initState, hash_state)
+
+    def search(self, timebound=None, costbound=None, node_budget=None, clock='cpu'):
         """
         Start searching, using the parameters set by init_search.
 
         @param timebound: the maximum amount of time, in seconds, to spend on this search.
         @param costbound: the cost bound 3-tuple for pruning, as specified in the assignment.
+        @param node_budget: the maximum number of nodes to expand in this search.
+        @param clock: 'cpu' to measure timebound in CPU time or 'wall' to measure it in
+                      elapsed time (hdastar always uses elapsed time and ignores node_budget).
 
         This code will return a goal path (if one is found) as well as a SearchStat object containing
         statistics about the given search (assuming a solution is found).
@@ -367,27 +857,237 @@ class SearchEngine:
         goal_node = []
 
         ###NOW do the search and return the result
-        self.search_start_time = os.times()[0]
-        self.search_stop_time = None
-        if timebound:
-            self.search_stop_time = self.search_start_time + timebound
-        goal_node = self._searchOpen(self.goal_fn, self.heur_fn, self.fval_function, costbound)
+        if not self._startLimits(timebound, node_budget, clock):
+            return False, None
+        self._startClock()
+        if self.strategy == _IDASTAR:
+            goal_node = self._searchIDAstar(self.goal_fn, self.heur_fn, costbound)
+        elif self.strategy == _BIDIRECTIONAL:
+            goal_node = self._searchBidirectional(costbound)
+        elif self.strategy == _HDASTAR:
+            goal_node = self._searchHDAstar(timebound, costbound)
+        elif self.strategy == _MHASTAR:
+            goal_node = self._searchMHAstar(costbound)
+        else:
+            goal_node = self._searchOpen(self.goal_fn, self.heur_fn, self.fval_function, costbound)
+        self._stopClock()
 
         if goal_node:
-            total_search_time = os.times()[0] - self.search_start_time
-            stats = SearchStats(sNode.n, StateSpace.n, self.cycle_check_pruned, self.cost_bound_pruned)
+            total_search_time = self.clock() - self.search_start_time
+            stats = self.get_stats()
             #print("Solution Found with cost of {} in search time of {} sec".format(goal_node.gval, total_search_time))
             #print("Nodes expanded = {}, states generated = {}, states cycle check pruned = {}, states cost bound pruned = {}".format(
-            #    sNode.n, StateSpace.n, self.cycle_check_pruned, self.cost_bound_pruned))
+            #    self.node_count, self.state_count, self.cycle_check_pruned, self.cost_bound_pruned))
             return goal_node.state, stats
         else:
             #exited the while without finding goal---search failed
-            total_search_time = os.times()[0] - self.search_start_time            
+            total_search_time = self.clock() - self.search_start_time            
             #print("Search Failed! No solution found.")
             #print("Nodes expanded = {}, states generated = {}, states cycle check pruned = {}, states cost bound pruned = {}".format(
-            #    sNode.n, StateSpace.n, self.cycle_check_pruned, self.cost_bound_pruned))
+            #    self.node_count, self.state_count, self.cycle_check_pruned, self.cost_bound_pruned))
             return False, None
 
+    def reprioritize(self, new_fval_function):
+        '''Switch a 'custom' search to a new fval function (e.g., with a
+           different weight) between calls to search. The priorities of
+           all nodes on OPEN are recomputed in one pass and the heap is
+           rebuilt in O(n); with full cycle checking stale nodes are
+           dropped from OPEN at the same time.'''
+        if self.strategy != _CUSTOM:
+            print("Only the 'custom' strategy has an fval function to change")
+            return
+        self.fval_function = new_fval_function
+        nodes = self.open.nodes()
+        if self.cycle_check == _CC_FULL:
+            gvals = self.cc_dictionary
+            nodes = [node for node in nodes if gvals[node.state.hashable_state()] == node.gval]
+        for node in nodes:
+            node.fval_function = new_fval_function
+        self.open.rebuild(nodes)
+
+    def anytime_search(self, weights, timebound=None, node_budget=None, clock='cpu'):
+        """
+        Anytime repairing A* (ARA*), starting from the search set up by
+        init_search (which must use the 'custom' strategy and full cycle
+        checking). This is a generator: each time a cheaper solution is
+        found it yields (goal state, SearchStats), like search does.
+
+        The search runs a weighted A* (fval = g + weight*h) for each weight
+        of weights in turn (a decreasing sequence, ideally ending with 1).
+        Each weighted search continues where the previous one stopped: the
+        nodes on OPEN are kept and re-prioritized for the new weight, and
+        states reached more cheaply after being expanded (the INCONS list)
+        are put back on OPEN. Within a weighted search a state is expanded
+        at most once, and once a solution is found successors that can't
+        lead to a cheaper one (g + h >= its cost) are pruned. After each
+        weighted search self.anytime_bound is a bound on how far the cost
+        of the best solution is from optimal (as a factor) when the
+        heuristic is admissible.
+
+        @param weights: the weights of the weighted searches.
+        @param timebound, node_budget, clock: limits on the whole anytime search, as for search.
+        """
+        if self.strategy != _CUSTOM or self.cycle_check != _CC_FULL:
+            print("Anytime search needs the 'custom' strategy with full cycle checking")
+            return
+        if not self._startLimits(timebound, node_budget, clock):
+            return
+        self._startClock()
+        gvals = self.cc_dictionary
+        goal_fn, heur_fn, heur_batch_fn = self.goal_fn, self.heur_fn, self.heur_batch_fn
+        best, best_cost = None, float('inf')
+        incons = dict()
+        self.anytime_bound = float('inf')
+
+        for weight in weights:
+            #OPEN = OPEN + INCONS, without stale nodes or nodes that can't
+            #improve on the best solution, re-prioritized for the new weight
+            fval_function = _weighted_fval_function(weight)
+            nodes = dict()
+            for node in self.open.nodes() + list(incons.values()):
+                hash_state = node.state.hashable_state()
+                if gvals[hash_state] == node.gval and (best is None or node.gval + node.hval < best_cost):
+                    node.fval_function = fval_function
+                    nodes[hash_state] = node
+            self.open.rebuild(nodes.values())
+            incons = dict()
+            closed = set()
+            self.anytime_weight = weight
+            #BEGIN TRACING
+            if self.trace:
+                print("   TRACE: Starting anytime iteration with weight {}, OPEN holds {} nodes".format(weight, len(nodes)))
+            #END TRACING
+
+            while not self.open.empty():
+                node = self.open.extract()
+                if best is not None and node.fval_function(node) >= best_cost:
+                    #no node on OPEN can lead to a cheaper solution with this weight
+                    self.open.insert(node)
+                    break
+                hash_state = node.state.hashable_state()
+                if gvals[hash_state] < node.gval:
+                    #reached more cheaply since this node was added
+                    continue
+                if goal_fn(node.state):
+                    #only the initial state is goal tested here, other
+                    #goals are caught when they are generated
+                    best, best_cost = node, node.gval
+                    self._stopClock()
+                    yield node.state, self.get_stats()
+                    self._startClock()
+                    continue
+                if self.search_limited and self._limitReached():
+                    self._stopClock()
+                    return
+                closed.add(hash_state)
+
+                self.expansions = self.expansions + 1
+                if self.monitor and self.expansions % self.monitor_every == 0:
+                    self.monitor(self.get_stats())
+                #successors that pass cycle checking, with their hashable states
+                kept = []
+                for succ in node.state.successors():
+                    succ.index = self.state_count
+                    self.state_count = self.state_count + 1
+                    succ_hash = succ.hashable_state()
+                    if succ_hash in gvals and succ.gval >= gvals[succ_hash]:
+                        self.cycle_check_pruned = self.cycle_check_pruned + 1
+                        continue
+                    kept.append((succ, succ_hash))
+                if heur_batch_fn is None or not kept:
+                    hvals = [heur_fn(succ) for succ, succ_hash in kept]
+                else:
+                    hvals = heur_batch_fn([succ for succ, succ_hash in kept])
+
+                for (succ, succ_hash), succ_hval in zip(kept, hvals):
+                    if succ_hash in gvals and succ.gval >= gvals[succ_hash]:
+                        #a path as cheap to the state was added by this expansion
+                        self.cycle_check_pruned = self.cycle_check_pruned + 1
+                        continue
+                    if best is not None and succ.gval + succ_hval >= best_cost:
+                        self.cost_bound_pruned = self.cost_bound_pruned + 1
+                        continue
+                    gvals[succ_hash] = succ.gval
+                    succ_node = sNode(succ, succ_hval, fval_function, self.node_count)
+                    self.node_count = self.node_count + 1
+                    if goal_fn(succ):
+                        best, best_cost = succ_node, succ.gval
+                        self._stopClock()
+                        yield succ, self.get_stats()
+                        self._startClock()
+                    elif succ_hash in closed:
+                        incons[succ_hash] = succ_node
+                    else:
+                        self.open.insert(succ_node)
+
+            #the best solution costs at most weight times the optimal cost,
+            #and at most best_cost/(the smallest g + h of a node still to expand)
+            fmin = min([node.gval + node.hval for node in self.open.nodes() + list(incons.values())
+                        if gvals[node.state.hashable_state()] == node.gval], default=float('inf'))
+            if fmin >= best_cost:
+                #nothing left to expand can lead to a cheaper solution
+                if best is not None:
+                    self.anytime_bound = 1
+                break
+            if best is not None:
+                self.anytime_bound = min(weight, best_cost / fmin) if fmin > 0 else weight
+        self._stopClock()
+
+    def _startClock(self):
+        '''Start timing a search (its time is added to search_time)'''
+        self.search_started = time.perf_counter()
+
+    def _stopClock(self):
+        '''Stop timing a search, adding the time since _startClock to search_time'''
+        self.search_time = self.search_time + time.perf_counter() - self.search_started
+        self.search_started = None
+
+    def _startLimits(self, timebound, node_budget, clock):
+        '''Set up the time bound and node budget of a search (see search).
+           Returns False if the clock is unknown.'''
+        if clock not in _CLOCKS:
+            print('Unknown clock "{}": must be one of {}'.format(clock, list(_CLOCKS)))
+            return False
+        self.clock = _CLOCKS[clock]
+        self.search_start_time = self.clock()
+        self.search_stop_time = None
+        if timebound:
+            self.search_stop_time = self.search_start_time + timebound
+        self.node_limit = None
+        if node_budget is not None:
+            self.node_limit = self.expansions + node_budget
+        self.search_limited = self.search_stop_time is not None or self.node_limit is not None
+        self.deadline_interval = 1
+        self.deadline_countdown = 1
+        self.deadline_checked = self.search_start_time
+        return True
+
+    def _limitReached(self):
+        '''True if the current search has used up its node budget or its
+           timebound. The clock is only read every deadline_interval calls,
+           and the interval is doubled or halved to keep clock reads about
+           _DEADLINE_TOLERANCE seconds apart.'''
+        if self.node_limit is not None and self.expansions >= self.node_limit:
+            print("TRACE: Search has exceeded the node budget provided.")
+            return True
+        if self.search_stop_time is None:
+            return False
+        self.deadline_countdown = self.deadline_countdown - 1
+        if self.deadline_countdown > 0:
+            return False
+
+        now = self.clock()
+        if now - self.deadline_checked < _DEADLINE_TOLERANCE / 2:
+            self.deadline_interval = self.deadline_interval * 2
+        elif now - self.deadline_checked > _DEADLINE_TOLERANCE and self.deadline_interval > 1:
+            self.deadline_interval = self.deadline_interval // 2
+        self.deadline_checked = now
+        self.deadline_countdown = self.deadline_interval
+        if now > self.search_stop_time:
+            print("TRACE: Search has exceeeded the time bound provided.")
+            return True
+        return False
+
     def _searchOpen(self, goal_fn, heur_fn, fval_function, costbound):
         """
         Search, starting from self.open.
@@ -403,8 +1103,19 @@ class SearchEngine:
             if self.cycle_check == _CC_FULL:
                 print("   TRACE: Initial CC_Dict:", self.cc_dictionary)
         #END TRACING
+        profile = self.profile
+        clock = time.perf_counter
+        heur_batch_fn = self.heur_batch_fn
         while not self.open.empty():
+            #BEGIN PROFILING
+            if profile:
+                self.peak_open = max(self.peak_open, len(self.open.open))
+                if self.cycle_check == _CC_FULL:
+                    self.peak_closed = max(self.peak_closed, len(self.cc_dictionary))
+                t = clock()
+            #END PROFILING
             node = self.open.extract()
+            if profile: self.time_open = self.time_open + clock() - t
 
             #BEGIN TRACING
             if self.trace:
@@ -418,10 +1129,8 @@ class SearchEngine:
               #node at front of OPEN is a goal...search is completed.
               return node
 
-            if self.search_stop_time: #timebound check
-              if os.times()[0] > self.search_stop_time:                
-                #exceeded time bound, must terminate search
-                print("TRACE: Search has exceeeded the time bound provided.")
+            if self.search_limited and self._limitReached():
+                #exceeded time bound or node budget, must terminate search
                 return False
 
              #All states reached by a search node on OPEN have already
@@ -440,7 +1149,24 @@ class SearchEngine:
             if self.cycle_check == _CC_FULL and self.cc_dictionary[node.state.hashable_state()] < node.gval:
                 continue
 
+            if self.path_states is not None:
+                #backtrack to the node's parent, then extend the path to the node
+                while self.path_states and self.path_states[-1] is not node.state.parent:
+                    self.path_states.pop()
+                    self.path_set.remove(self.path_hashes.pop())
+                self.path_states.append(node.state)
+                self.path_hashes.append(node.state.hashable_state())
+                self.path_set.add(self.path_hashes[-1])
+
+            if profile: t = clock()
             successors = node.state.successors()
+            if profile: self.time_successors = self.time_successors + clock() - t
+            for succ in successors:
+                succ.index = self.state_count
+                self.state_count = self.state_count + 1
+            self.expansions = self.expansions + 1
+            if self.monitor and self.expansions % self.monitor_every == 0:
+                self.monitor(self.get_stats())
 
             #BEGIN TRACING
             if self.trace:
@@ -451,7 +1177,10 @@ class SearchEngine:
                 print("}")
             #END TRACING
 
+            #successors that pass cycle checking, with their hashable states
+            kept = []
             for succ in successors:
+                if profile: t = clock()
                 hash_state = succ.hashable_state()
                 if self.trace > 1: 
                   if self.cycle_check == _CC_FULL and hash_state in self.cc_dictionary:
@@ -477,8 +1206,10 @@ class SearchEngine:
                               succ.gval > self.cc_dictionary[hash_state]
                              ) or (
                               self.cycle_check == _CC_PATH and
-                              succ.has_path_cycle()
+                              (hash_state in self.path_set if self.path_states is not None
+                               else succ.has_path_cycle())
                              )
+                if profile: self.time_cycle_check = self.time_cycle_check + clock() - t
 
                 if prune_succ :
                     self.cycle_check_pruned = self.cycle_check_pruned + 1
@@ -489,7 +1220,21 @@ class SearchEngine:
                     #END TRACING
                     continue
 
-                succ_hval = heur_fn(succ)
+                kept.append((succ, hash_state))
+
+            if profile: t = clock()
+            if heur_batch_fn is None or not kept:
+                hvals = [heur_fn(succ) for succ, hash_state in kept]
+            else:
+                hvals = heur_batch_fn([succ for succ, hash_state in kept])
+            if profile: self.time_heuristic = self.time_heuristic + clock() - t
+
+            for (succ, hash_state), succ_hval in zip(kept, hvals):
+                if (self.cycle_check == _CC_FULL and hash_state in self.cc_dictionary and
+                    succ.gval > self.cc_dictionary[hash_state]):
+                    #a cheaper path to the state was added by this expansion
+                    self.cycle_check_pruned = self.cycle_check_pruned + 1
+                    continue
                 if costbound is not None and (succ.gval > costbound[0] or
                                               succ_hval > costbound[1] or
                                               succ.gval + succ_hval > costbound[2]) : 
@@ -500,7 +1245,10 @@ class SearchEngine:
                     continue                    
 
                 #passed all cycle checks and costbound checks ...add to open
-                self.open.insert(sNode(succ, succ_hval, node.fval_function))
+                if profile: t = clock()
+                self.open.insert(sNode(succ, succ_hval, node.fval_function, self.node_count))
+                if profile: self.time_open = self.time_open + clock() - t
+                self.node_count = self.node_count + 1
 
                 #BEGIN TRACING
                 if self.trace > 1:
@@ -512,6 +1260,701 @@ class SearchEngine:
                 if self.cycle_check == _CC_FULL:
                     self.cc_dictionary[hash_state] = succ.gval
 
+            if self.max_nodes:
+                stored = len(self.cc_dictionary) if self.cycle_check == _CC_FULL else len(self.open.open)
+                if stored > self.max_nodes:
+                    self._evict()
+
         #end of while--OPEN is empty and no solution
         return False
             
+
+
+    def _evict(self):
+        """
+        Memory bounded (SMA* style) search: called when the nodes stored on
+        OPEN and in the cycle check dictionary exceed max_nodes, forgets a
+        batch of nodes to get back under the bound.
+
+        a. The nodes on OPEN with the worst priority are evicted, and their
+           states dropped from the cycle check dictionary so that they can
+           be generated again.
+        b. The f-value of the evicted nodes is backed up to their parents:
+           each parent goes back on OPEN with its hval raised so that its
+           f-value is the smallest f-value of its evicted children. The
+           parent is therefore expanded again (regenerating the evicted
+           children) only once the rest of OPEN is no more promising.
+        c. If the cycle check dictionary is still too large, the oldest
+           states that are not on OPEN are dropped from it; these states
+           may be expanded again if reached again.
+        """
+        batch = max(1, self.max_nodes // 20)
+        heap = self.open.open
+        full = self.cycle_check == _CC_FULL
+
+        backed_up = dict()
+        for node in heap.evict(min(batch, len(heap) - 1)):
+            self.nodes_evicted = self.nodes_evicted + 1
+            hash_state = node.state.hashable_state()
+            if full and self.cc_dictionary.get(hash_state) == node.gval:
+                del self.cc_dictionary[hash_state]
+            parent = node.state.parent
+            if parent is None:
+                continue
+            fval = node.gval + node.hval
+            parent_hash = parent.hashable_state()
+            if parent_hash not in backed_up or fval < backed_up[parent_hash][1]:
+                backed_up[parent_hash] = (parent, fval)
+
+        for parent_hash, (parent, fval) in backed_up.items():
+            old = heap.get(parent_hash)
+            if old is not None:
+                if old.gval + old.hval <= fval:
+                    continue
+                heap.remove(parent_hash)
+            elif full and self.cc_dictionary.get(parent_hash, parent.gval) < parent.gval:
+                #the parent has since been reached by a cheaper path
+                continue
+            heap.push(sNode(parent, fval - parent.gval, self.fval_function, self.node_count))
+            self.node_count = self.node_count + 1
+            if full:
+                self.cc_dictionary[parent_hash] = parent.gval
+
+        if full and len(self.cc_dictionary) > self.max_nodes - batch:
+            excess = len(self.cc_dictionary) - (self.max_nodes - batch)
+            dropped = []
+            for hash_state in self.cc_dictionary:
+                if hash_state not in heap:
+                    dropped.append(hash_state)
+                    if len(dropped) == excess:
+                        break
+            for hash_state in dropped:
+                del self.cc_dictionary[hash_state]
+
+    def _searchIDAstar(self, goal_fn, heur_fn, costbound):
+        """
+        Iterative deepening A*: a sequence of depth first searches, each
+        visiting only the nodes whose f-value (gval+hval) is within a
+        threshold. The first threshold is the hval of the initial state,
+        each following one the smallest f-value that exceeded the previous
+        threshold. Memory is linear in the depth of the search: the only
+        stored nodes are those on the current path (with their successors).
+
+        Unless cycle checking is 'none', successors that repeat a state on
+        their path are pruned. If the engine has a transposition table
+        (tt_size > 0) it also remembers up to tt_size states visited in the
+        current iteration with their g-value, and prunes states reached
+        again with no smaller g-value.
+
+        The depth first stack is kept between calls, so calling search
+        again after a goal is found resumes the iteration where it
+        stopped (as searching again from OPEN does for other strategies).
+
+        @param goal_fn: the goal function.
+        @param heur_fn: the heuristic function.
+        @param costbound: the cost bound 3-tuple, as described in the assignment.
+        """
+        if self.ida_stack is None:
+            #first call: start the first iteration at the initial state
+            root = self.init_state
+            self.ida_threshold = heur_fn(root)
+            self._startIteration()
+            if goal_fn(root):
+                return sNode(root, self.ida_threshold, self.fval_function, 0)
+
+        stack = self.ida_stack
+        path_set = self.ida_path_set
+        tt = self.ida_tt
+        path_check = self.cycle_check != _CC_NONE
+
+        while True:
+            while stack:
+                successors = stack[-1]
+                if not successors:
+                    #backtrack
+                    stack.pop()
+                    if path_check:
+                        path_set.remove(self.ida_path_hashes.pop())
+                    continue
+                succ = successors.pop()
+
+                hash_state = succ.hashable_state()
+                if (path_check and hash_state in path_set) or (
+                        tt is not None and hash_state in tt and tt[hash_state] <= succ.gval):
+                    self.cycle_check_pruned = self.cycle_check_pruned + 1
+                    continue
+
+                succ_hval = heur_fn(succ)
+                if costbound is not None and (succ.gval > costbound[0] or
+                                              succ_hval > costbound[1] or
+                                              succ.gval + succ_hval > costbound[2]) :
+                    self.cost_bound_pruned = self.cost_bound_pruned + 1
+                    continue
+
+                fval = succ.gval + succ_hval
+                if fval > self.ida_threshold:
+                    #outside this iteration, remember the smallest such fval
+                    if fval < self.ida_next_threshold:
+                        self.ida_next_threshold = fval
+                    continue
+
+                node = sNode(succ, succ_hval, self.fval_function, self.node_count)
+                self.node_count = self.node_count + 1
+
+                if goal_fn(succ):
+                    return node
+
+                if self.search_limited and self._limitReached():
+                    #exceeded time bound or node budget, must terminate search
+                    return False
+
+                if tt is not None and (len(tt) < self.tt_size or hash_state in tt):
+                    tt[hash_state] = succ.gval
+
+                #descend to the successor. Successors are pushed in reverse
+                #so they are visited in the order successors() returns them
+                successors = succ.successors()
+                self.expansions = self.expansions + 1
+                if self.monitor and self.expansions % self.monitor_every == 0:
+                    self.monitor(self.get_stats())
+                for ss in successors:
+                    ss.index = self.state_count
+                    self.state_count = self.state_count + 1
+                successors.reverse()
+                stack.append(successors)
+                if path_check:
+                    self.ida_path_hashes.append(hash_state)
+                    path_set.add(hash_state)
+
+            #iteration exhausted: deepen, unless nothing was cut off
+            if self.ida_next_threshold == float('inf'):
+                return False
+            self.ida_threshold = self.ida_next_threshold
+            self._startIteration()
+            stack = self.ida_stack
+            path_set = self.ida_path_set
+            tt = self.ida_tt
+
+    def _startIteration(self):
+        '''Set up the depth first stack of a new IDA* iteration'''
+        #BEGIN TRACING
+        if self.trace:
+            print("   TRACE: Starting IDA* iteration with f-value threshold", self.ida_threshold)
+        #END TRACING
+        root = self.init_state
+        successors = root.successors()
+        for ss in successors:
+            ss.index = self.state_count
+            self.state_count = self.state_count + 1
+        successors.reverse()
+        self.ida_stack = [successors]
+        self.ida_path_hashes = [root.hashable_state()]
+        self.ida_path_set = set(self.ida_path_hashes)
+        self.ida_tt = dict() if self.tt_size else None
+        self.ida_next_threshold = float('inf')
+
+    def _bidirectionalAdd(self, direction, state, hash_state):
+        '''Put a state generated by one side of a bidirectional search on its frontier'''
+        self.bd_gvals[direction][hash_state] = state.gval
+        heapq.heappush(self.bd_open[direction], (state.gval, self.node_count, state))
+        self.node_count = self.node_count + 1
+        self.bd_meet[direction].setdefault(self.meet_key_fn(state), []).append(state)
+
+    def _searchBidirectional(self, costbound):
+        """
+        Bidirectional search, starting from the two frontiers set up by
+        init_bidirectional_search. Calling search again after a goal is
+        found continues the search for other solutions (of no greater cost
+        than costbound[0], if given).
+
+        @param costbound: the cost bound 3-tuple; only its gval component is used.
+        """
+        gval_bound = float('inf') if costbound is None else costbound[0]
+        best, best_goal, best_pair = float('inf'), None, None
+
+        #the states already met: each new state is joined with the states of
+        #the other side it can meet
+        def meet(direction, state):
+            nonlocal best, best_goal, best_pair
+            for other in self.bd_meet[1 - direction].get(self.meet_key_fn(state), ()):
+                cost = state.gval + other.gval
+                if cost >= best or cost > gval_bound:
+                    continue
+                forward, backward = (state, other) if direction == 0 else (other, state)
+                pair = (forward.hashable_state(), backward.hashable_state(), cost)
+                if pair in self.bd_joined:
+                    continue
+                goal = self.join_fn(forward, backward)
+                if goal:
+                    best, best_goal, best_pair = cost, goal, pair
+
+        if not self.bd_joined:
+            for state in [entry[2] for entry in self.bd_open[0]]:
+                meet(0, state)
+
+        while self.bd_open[0] or self.bd_open[1]:
+            #any solution not yet found joins states not yet expanded on
+            #both sides (or on the side that is not exhausted)
+            tops = [frontier[0][0] if frontier else 0 for frontier in self.bd_open]
+            if best_goal is not None and tops[0] + tops[1] >= best:
+                break
+
+            if self.search_limited and self._limitReached():
+                #exceeded time bound or node budget, must terminate search
+                return False
+
+            if not self.bd_open[1] or (self.bd_open[0] and len(self.bd_open[0]) <= len(self.bd_open[1])):
+                direction = 0
+            else:
+                direction = 1
+            gval, number, state = heapq.heappop(self.bd_open[direction])
+            gvals = self.bd_gvals[direction]
+            if gvals[state.hashable_state()] < gval:
+                #reached more cheaply since this entry was added
+                continue
+
+            #BEGIN TRACING
+            if self.trace:
+                print("   TRACE: Expanding {} state <S{}:{}:{}, g={}>".format(
+                    ('forward', 'backward')[direction], state.index, state.action, state.hashable_state(), gval))
+            #END TRACING
+
+            self.expansions = self.expansions + 1
+            if self.monitor and self.expansions % self.monitor_every == 0:
+                self.monitor(self.get_stats())
+            for succ in state.successors():
+                succ.index = self.state_count
+                self.state_count = self.state_count + 1
+                hash_state = succ.hashable_state()
+                if hash_state in gvals and succ.gval >= gvals[hash_state]:
+                    self.cycle_check_pruned = self.cycle_check_pruned + 1
+                    continue
+                if succ.gval > gval_bound:
+                    self.cost_bound_pruned = self.cost_bound_pruned + 1
+                    continue
+                self._bidirectionalAdd(direction, succ, hash_state)
+                meet(direction, succ)
+
+        if best_goal is None:
+            return False
+        self.bd_joined.add(best_pair)
+        return sNode(best_goal, 0, _fval_function, self.node_count)
+
+    def _multiHeuristicAdd(self, state, hash_state):
+        '''Put a state generated by a multi-heuristic search on the anchor
+           queue and on the queues of the other heuristics whose key is
+           within the anchor_weight bound (unless expanded by them already)'''
+        hvals = self.mha_hvals.get(hash_state)
+        if hvals is None:
+            hvals = self.mha_hvals[hash_state] = [heur_fn(state) for heur_fn in self.heur_fns]
+        anchor_key = state.gval + self.mha_weight * hvals[0]
+        if hash_state not in self.mha_closed_anchor:
+            heapq.heappush(self.mha_open[0], (anchor_key, self.node_count, state, hash_state))
+            self.node_count = self.node_count + 1
+        if hash_state not in self.mha_closed:
+            for i in range(1, len(hvals)):
+                key = state.gval + self.mha_weight * hvals[i]
+                if key <= self.mha_anchor_weight * anchor_key:
+                    heapq.heappush(self.mha_open[i], (key, self.node_count, state, hash_state))
+                    self.node_count = self.node_count + 1
+        return hvals
+
+    def _multiHeuristicTop(self, i):
+        '''The smallest key on queue i of a multi-heuristic search (inf if it
+           is empty), after dropping the stale entries at the top'''
+        queue = self.mha_open[i]
+        gvals = self.cc_dictionary
+        while queue:
+            key, number, state, hash_state = queue[0]
+            if gvals[hash_state] < state.gval or self.mha_expanded.get(hash_state, float('inf')) <= state.gval:
+                #reached more cheaply since, or already expanded by another queue
+                heapq.heappop(queue)
+            else:
+                return key
+        return float('inf')
+
+    def _multiHeuristicQueue(self):
+        '''The queue (other than the anchor) a multi-heuristic search takes
+           its next turn from'''
+        n = len(self.mha_open) - 1
+        if self.mha_schedule == 'round_robin':
+            self.mha_turn = self.mha_turn % n + 1
+            return self.mha_turn
+        #UCB1: the queue with the best upper confidence bound on how often
+        #its expansions lower its heuristic (each queue is tried once first)
+        plays = self.mha_plays
+        total = sum(plays[1:])
+        best, best_bound = 1, -1
+        for i in range(1, n + 1):
+            if plays[i] == 0:
+                return i
+            bound = self.mha_wins[i] / plays[i] + math.sqrt(2 * math.log(total) / plays[i])
+            if bound > best_bound:
+                best, best_bound = i, bound
+        return best
+
+    def _searchMHAstar(self, costbound):
+        """
+        Multi-heuristic A*, starting from the queues set up by
+        init_multi_heuristic_search.
+
+        @param costbound: the cost bound 3-tuple; only its gval component is used.
+        """
+        gval_bound = float('inf') if costbound is None else costbound[0]
+        gvals = self.cc_dictionary
+        goal_fn = self.goal_fn
+        n = len(self.mha_open)
+
+        while True:
+            anchor_key = self._multiHeuristicTop(0)
+            if anchor_key == float('inf'):
+                break
+            i = self._multiHeuristicQueue() if n > 1 else 0
+            key = self._multiHeuristicTop(i) if i else anchor_key
+            if key > self.mha_anchor_weight * anchor_key:
+                #the other queue is too far from the bound, expand the anchor
+                self.mha_plays[i] = self.mha_plays[i] + 1
+                i, key = 0, anchor_key
+            if self.mha_goal is not None and self.mha_goal.gval <= key:
+                #no state on the queue can lead to a cheaper solution within the bound
+                break
+
+            if self.search_limited and self._limitReached():
+                #exceeded time bound or node budget, must terminate search
+                return False
+
+            key, number, state, hash_state = heapq.heappop(self.mha_open[i])
+            self.mha_expanded[hash_state] = state.gval
+            if i == 0:
+                self.mha_closed_anchor.add(hash_state)
+            else:
+                self.mha_closed.add(hash_state)
+
+            #BEGIN TRACING
+            if self.trace:
+                print("   TRACE: Expanding state of queue {} <S{}:{}:{}, g={}, key={}>".format(
+                    i, state.index, state.action, hash_state, state.gval, key))
+            #END TRACING
+
+            self.expansions = self.expansions + 1
+            if self.monitor and self.expansions % self.monitor_every == 0:
+                self.monitor(self.get_stats())
+            progress = False
+            for succ in state.successors():
+                succ.index = self.state_count
+                self.state_count = self.state_count + 1
+                succ_hash = succ.hashable_state()
+                if succ_hash in gvals and succ.gval >= gvals[succ_hash]:
+                    self.cycle_check_pruned = self.cycle_check_pruned + 1
+                    continue
+                if succ.gval > gval_bound:
+                    self.cost_bound_pruned = self.cost_bound_pruned + 1
+                    continue
+                gvals[succ_hash] = succ.gval
+                if goal_fn(succ) and (self.mha_goal is None or succ.gval < self.mha_goal.gval):
+                    self.mha_goal = succ
+                hvals = self._multiHeuristicAdd(succ, succ_hash)
+                if i and hvals[i] < self.mha_best_hval[i]:
+                    self.mha_best_hval[i] = hvals[i]
+                    progress = True
+            if i:
+                self.mha_plays[i] = self.mha_plays[i] + 1
+                if progress:
+                    self.mha_wins[i] = self.mha_wins[i] + 1
+
+        if self.mha_goal is None:
+            return False
+        return sNode(self.mha_goal, 0, _fval_function, self.node_count)
+
+    def _searchHDAstar(self, timebound, costbound):
+        """
+        Hash distributed A*: the states are partitioned among worker
+        processes by the hash of their hashable_state(). Each worker keeps
+        the OPEN set and closed list of its own states, expands them, and
+        sends the successors it generates to the workers that own them.
+
+        A goal found by a worker becomes the incumbent solution, shared by
+        all workers, which then only expand nodes with a smaller f-value.
+        The search ends when all workers are idle (their OPEN sets hold no
+        node that could lead to a cheaper solution) and no messages are in
+        transit; the incumbent is then optimal (if the heuristic is
+        admissible). The path to the goal is rebuilt from the parent keys
+        stored by the workers.
+
+        The goal and heuristic functions are used in the worker processes,
+        so where processes are spawned rather than forked they must be
+        picklable, and hash(hashable_state()) must be the same in every
+        process. The timebound is wall clock time. Calling search again
+        runs a new parallel search, skipping the goals already returned.
+
+        @param timebound: the maximum amount of (wall clock) time, in seconds, to spend on this search.
+        @param costbound: the cost bound 3-tuple, as described in the assignment.
+        """
+        n = self.workers or os.cpu_count() or 1
+        inboxes = [multiprocessing.Queue() for i in range(n)]
+        results = multiprocessing.Queue()
+        shared = _HDAShared(n)
+        workers = [multiprocessing.Process(target=_hda_worker,
+                                           args=(rank, inboxes, results, shared, self.goal_fn,
+                                                 self.heur_fn, costbound, self.hda_found))
+                   for rank in range(n)]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+
+        root = self.init_state
+        shared.sent[n] = 1
+        inboxes[hash(root.hashable_state()) % n].put(('states', [(root, None)]))
+
+        #wait for termination (Mattern's four counter method): every worker
+        #idle and as many messages received as sent, with the same counts
+        #in two passes in a row (the counts only grow, so no message was
+        #sent or received between the passes)
+        stop_time = os.times()[4] + timebound if timebound else None
+        timed_out = False
+        previous = None
+        while True:
+            if stop_time and os.times()[4] > stop_time:
+                print("TRACE: Search has exceeeded the time bound provided.")
+                timed_out = True
+                break
+            if not all(worker.is_alive() for worker in workers):
+                break
+            received = sum(shared.received)
+            idle = all(shared.idle)
+            sent = sum(shared.sent)
+            current = (idle, sent, received)
+            if idle and sent == received and current == previous:
+                break
+            previous = current
+            time.sleep(0.001)
+        shared.stop.value = 1
+
+        def result():
+            #the next message from the workers, or None if one of them died
+            while True:
+                try:
+                    return results.get(timeout=0.1)
+                except queue.Empty:
+                    if not all(worker.is_alive() for worker in workers):
+                        return None
+
+        for inbox in inboxes:
+            inbox.put(('stats',))
+        goals = []
+        reports = 0
+        failed = False
+        while reports < n:
+            message = result()
+            if message is None:
+                failed = True
+                break
+            if message[0] == 'goal':
+                goals.append(message[1:])
+            else:
+                reports = reports + 1
+                expanded, generated, cycle_pruned, cost_pruned = message[1:]
+                self.node_count = self.node_count + expanded
+                self.state_count = self.state_count + generated
+                self.cycle_check_pruned = self.cycle_check_pruned + cycle_pruned
+                self.cost_bound_pruned = self.cost_bound_pruned + cost_pruned
+
+        goal_node = False
+        if goals and not timed_out and not failed:
+            gval, rank, hash_state = min(goals, key=lambda goal: goal[0])
+            #follow the parent keys back to the initial state, asking each
+            #state's owner for it
+            path = []
+            while hash_state is not None:
+                inboxes[rank].put(('trace', hash_state))
+                message = result()
+                if message is None:
+                    failed = True
+                    break
+                hash_state, state = message[1:]
+                path.append(state)
+                rank = hash(hash_state) % n if hash_state is not None else None
+            if not failed:
+                self.hda_found.add(path[0].hashable_state())
+                parent = None
+                for state in reversed(path):
+                    state.parent = parent
+                    parent = state
+                goal_node = sNode(path[0], 0, self.fval_function, self.node_count)
+
+        if failed:
+            print("TRACE: A worker process of the search died.")
+            for worker in workers:
+                worker.terminate()
+        else:
+            for inbox in inboxes:
+                inbox.put(('exit',))
+        for worker in workers:
+            worker.join()
+        return goal_node
+
+class _HDAShared:
+    '''State shared by the processes of a hash distributed A* search'''
+
+    def __init__(self, n):
+        #cost of the best solution found so far
+        self.incumbent = multiprocessing.Value('d', float('inf'))
+        #set by the search engine to stop the workers
+        self.stop = multiprocessing.Value('b', 0, lock=False)
+        #per worker: idle flag, number of messages sent and received. The
+        #last sent counter is the search engine's (for the initial state)
+        self.idle = multiprocessing.Array('b', n, lock=False)
+        self.sent = multiprocessing.Array('l', n + 1, lock=False)
+        self.received = multiprocessing.Array('l', n, lock=False)
+
+def _hda_worker(rank, inboxes, results, shared, goal_fn, heur_fn, costbound, excluded):
+    '''Worker process of a hash distributed A* search (see SearchEngine._searchHDAstar)'''
+    n = len(inboxes)
+    inbox = inboxes[rank]
+    frontier = []
+    #closed list: hashable_state -> (gval, hashable_state of parent, state)
+    closed = dict()
+    outbox = [[] for i in range(n)]
+    counts = [0, 0, 0, 0]    #expanded, generated, cycle pruned, cost pruned
+
+    def flush(owner):
+        shared.sent[rank] = shared.sent[rank] + 1
+        inboxes[owner].put(('states', outbox[owner]))
+        outbox[owner] = []
+
+    def add(state, parent_hash):
+        hash_state = state.hashable_state()
+        if hash_state in closed and closed[hash_state][0] <= state.gval:
+            counts[2] = counts[2] + 1
+            return
+        hval = heur_fn(state)
+        if costbound is not None and (state.gval > costbound[0] or
+                                      hval > costbound[1] or
+                                      state.gval + hval > costbound[2]):
+            counts[3] = counts[3] + 1
+            return
+        closed[hash_state] = (state.gval, parent_hash, state)
+        heapq.heappush(frontier, (state.gval + hval, -state.gval, counts[0], state))
+        counts[0] = counts[0] + 1
+
+    def handle(message):
+        if message[0] == 'states':
+            shared.idle[rank] = 0
+            if not shared.stop.value:
+                for state, parent_hash in message[1]:
+                    add(state, parent_hash)
+            shared.received[rank] = shared.received[rank] + 1
+        elif message[0] == 'stats':
+            results.put(('stats',) + tuple(counts))
+        elif message[0] == 'trace':
+            gval, parent_hash, state = closed[message[1]]
+            results.put(('trace', parent_hash, state))
+        return message[0] != 'exit'
+
+    expansions = 0
+    while True:
+        try:
+            while True:
+                if not handle(inbox.get_nowait()):
+                    return
+        except queue.Empty:
+            pass
+
+        if not shared.stop.value and frontier and frontier[0][0] < shared.incumbent.value:
+            shared.idle[rank] = 0
+            fval, neg_gval, number, state = heapq.heappop(frontier)
+            hash_state = state.hashable_state()
+            if closed[hash_state][0] < state.gval:
+                continue
+            if goal_fn(state):
+                if hash_state not in excluded:
+                    with shared.incumbent.get_lock():
+                        if state.gval < shared.incumbent.value:
+                            shared.incumbent.value = state.gval
+                            results.put(('goal', state.gval, rank, hash_state))
+                continue
+            for succ in state.successors():
+                counts[1] = counts[1] + 1
+                #states travel without their parent, which is kept by key
+                succ.parent = None
+                owner = hash(succ.hashable_state()) % n
+                if owner == rank:
+                    add(succ, hash_state)
+                else:
+                    outbox[owner].append((succ, hash_state))
+                    if len(outbox[owner]) >= 64:
+                        flush(owner)
+            expansions = expansions + 1
+            if expansions % 16 == 0:
+                for owner in range(n):
+                    if outbox[owner]:
+                        flush(owner)
+        else:
+            for owner in range(n):
+                if outbox[owner]:
+                    flush(owner)
+            shared.idle[rank] = 1
+            try:
+                if not handle(inbox.get(timeout=0.01)):
+                    return
+            except queue.Empty:
+                pass
+
+def _solve_one(job):
+    '''Worker for solve_many: run one search and return its result.'''
+    (problem_id, initState, goal_fn, strategy, cc_level, heur_fn,
+     fval_function, timebound, costbound) = job
+    se = SearchEngine(strategy, cc_level)
+    se.init_search(initState, goal_fn, heur_fn, fval_function)
+    goal_state, stats = se.search(timebound, costbound)
+    if not goal_state:
+        #search returns no statistics when it fails, but the counters of a
+        #timed out search are still worth reporting
+        return problem_id, False, se.get_stats()
+    #return the path from the initial state to the goal (rather than just
+    #the goal state) so that it is pickled root first, one state at a time
+    path = []
+    s = goal_state
+    while s:
+        path.append(s)
+        s = s.parent
+    path.reverse()
+    return problem_id, path, stats
+
+def solve_many(problems, goal_fn, strategy='astar', heur_fn=_zero_hfn, timebound=None,
+               costbound=None, cc_level='default', fval_function=_fval_function, workers=None):
+    '''
+    Solve a batch of problems, running one search per problem on a pool of
+    worker processes. This is a generator: results are yielded as the
+    searches finish (not in the order of problems).
+
+    @param problems: a sequence of initial states. A problem's id is its position in the sequence.
+    @param goal_fn: the goal function for the problems
+    @param strategy: the search strategy (see SearchEngine.set_strategy)
+    @param heur_fn: the heuristic function to use
+    @param timebound: the maximum amount of time, in seconds, to spend on each problem
+    @param costbound: the cost bound 3-tuple for pruning
+    @param cc_level: the cycle check level (see SearchEngine.set_strategy)
+    @param fval_function: the f-value function (only relevant for custom search strategy)
+    @param workers: the number of worker processes (defaults to the number of CPUs)
+
+    Yields (problem_id, path, stats) tuples where path is the list of states
+    from the initial state to the goal state (or False if the search failed)
+    and stats is the SearchStats object of the search (whether or not it
+    found a goal).
+
+    The functions passed in are sent to the worker processes so they must be
+    picklable, i.e., defined at the top level of a module (use
+    functools.partial rather than a lambda to fix a weight in an fval function).
+    '''
+    jobs = [(problem_id, initState, goal_fn, strategy, cc_level, heur_fn,
+             fval_function, timebound, costbound)
+            for problem_id, initState in enumerate(problems)]
+    if workers == 1:
+        for job in jobs:
+            yield _solve_one(job)
+        return
+
+    with multiprocessing.Pool(workers) as pool:
+        for result in pool.imap_unordered(_solve_one, jobs):
+            yield result
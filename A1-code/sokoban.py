@@ -4,13 +4,46 @@
 
     A specializion of the StateSpace Class that is tailored to the game of Sokoban.
 
-    B) class Direction
+    B) Class SokobanMap
+
+    The static part of a Sokoban problem (dimensions, storage points and obstacles),
+    shared by all the states of the problem, with tables of distances to the storage
+    points for heuristics and the set of dead squares (from which no box reaches storage).
+
+    C) Class SokobanPatternDatabase
+
+    An additive pattern database heuristic for a SokobanMap: a lower bound of the pushes
+    needed to store each small set of boxes, saved to disk once per map.
+
+    D) Class PackedSokobanState
+
+    A compact alternative to SokobanState that keeps the robots and boxes packed into
+    a single integer and refers to a shared SokobanMap for everything else.
+
+    E) Class SokobanPushState
+
+    A SokobanState whose successors are whole box pushes (a robot's walk to a box and
+    the push), which makes solutions far shorter in number of states.
+
+    F) Class SokobanRegressionState
+
+    A state of a backward search from the goal, for bidirectional search.
+
+    G) class Direction
 
     An encoding of the directions of movement that are possible for robots in Sokoban.
 
     Code also contains a list of 40 Sokoban problems for the purpose of testing.
 '''
 
+import hashlib
+import itertools
+import math
+import os
+import random
+import threading
+from collections import deque
+import numpy as np
 from search import *
 
 class SokobanState(StateSpace):
@@ -32,16 +65,27 @@ class SokobanState(StateSpace):
         self.boxes = boxes
         self.storage = storage
         self.obstacles = obstacles    
+        self.key = None
+        self.zobrist = None
+        self.cells = None
 
     def successors(self):
         '''
         Generates all the actions that can be performed from this state, and the states those actions will create.        
+        Pushes of a box onto a dead square (see SokobanMap.dead_squares) are left out.
         '''
         successors = []
         transition_cost = 1
         moved_boxes = frozenset()
+        m = SokobanMap.get(self.width, self.height, self.storage, self.obstacles)
+        zobrist = self.zobrist_hash(m)
+        zobrist_boxes = m.zobrist_boxes
+        dead_squares = m.dead_squares()
+        width = self.width
+        cells = self.box_cells(m)
 
         for robot in range(0, len(self.robots)):
+          zobrist_robot = m.zobrist_robot(robot)
           for direction in (UP, RIGHT, DOWN, LEFT):
               new_location = direction.move(self.robots[robot])
               new_robots = list(self.robots);
@@ -61,6 +105,12 @@ class SokobanState(StateSpace):
               if new_location in moved_boxes:
                   continue
               
+              #a move changes one robot and at most one box, so the successor's
+              #Zobrist hash is the parent's with those cells XORed out and in
+              new_zobrist = (zobrist ^ zobrist_robot[self.robots[robot][1] * width + self.robots[robot][0]]
+                                     ^ zobrist_robot[new_location[1] * width + new_location[0]])
+              new_cells = cells
+
               if new_location in self.boxes:
                   new_box_location = direction.move(new_location)
                   
@@ -74,23 +124,66 @@ class SokobanState(StateSpace):
                       continue
                   if new_box_location in new_boxes:
                       continue
+                  if dead_squares >> (new_box_location[1] * width + new_box_location[0]) & 1:
+                      #the box could never reach storage from there
+                      continue
                   
                   new_boxes.remove(new_location)
                   new_boxes.add(new_box_location)
                   new_moved_boxes.add(new_box_location)
+                  new_zobrist ^= (zobrist_boxes[new_location[1] * width + new_location[0]]
+                                  ^ zobrist_boxes[new_box_location[1] * width + new_box_location[0]])
+                  new_cells = list(cells)
+                  new_cells[new_cells.index(new_location[1] * width + new_location[0])] = new_box_location[1] * width + new_box_location[0]
+                  new_cells = tuple(new_cells)
               
               new_robots = list(self.robots)
               new_robots[robot] = new_location
               new_robots = tuple(new_robots)
 
               new_state = SokobanState(str(robot) + " " + direction.name, self.gval + transition_cost, self, self.width, self.height, new_robots, frozenset(new_boxes), self.storage, self.obstacles)
+              new_state.zobrist = new_zobrist
+              new_state.cells = new_cells
               successors.append(new_state)
 
         return successors
 
     def hashable_state(self):
         '''Return a data item that can be used as a dictionary key to UNIQUELY represent a state.'''
-        return hash((self.robots, self.boxes))       
+        #The key hashes to the state's Zobrist hash but compares the robots
+        #and boxes themselves: two different states can have equal hashes,
+        #and with exact keys the dictionary tells them apart by comparing
+        #keys whose hashes collide. Computed once and cached.
+        if self.key is None:
+            self.key = SokobanKey(self.zobrist_hash(), self.robots, self.boxes)
+        return self.key
+
+    def zobrist_hash(self, map=None):
+        '''
+        Returns the Zobrist hash of the robots and boxes. States generated by successors()
+        inherit it incrementally from their parent; it is computed from scratch only for
+        other states (e.g., initial states).
+        @param map: The SokobanMap of the room (looked up if not given).
+        '''
+        if self.zobrist is None:
+            if map is None:
+                map = SokobanMap.get(self.width, self.height, self.storage, self.obstacles)
+            self.zobrist = map.zobrist(self.robots, self.boxes)
+        return self.zobrist
+
+    def box_cells(self, map=None):
+        '''
+        Returns a tuple of the cells (see SokobanMap.cell) of the boxes, in no particular
+        order, for heuristics that index tables by cell (e.g., the batch heuristics of
+        solution.py). Like the Zobrist hash, states generated by successors() inherit it
+        from their parent, with the cell of the pushed box replaced.
+        @param map: The SokobanMap of the room (looked up if not given).
+        '''
+        if self.cells is None:
+            if map is None:
+                map = SokobanMap.get(self.width, self.height, self.storage, self.obstacles)
+            self.cells = tuple(map.cell(box) for box in self.boxes)
+        return self.cells
 
     def state_string(self):
         '''Returns a string representation fo a state that can be printed to stdout.'''        
@@ -106,6 +199,8 @@ class SokobanState(StateSpace):
         for obstacle in self.obstacles:
             map[obstacle[1]][obstacle[0]] = '#'
         for i, robot in enumerate(self.robots):
+            if robot is None:
+                continue
             if robot in self.storage:
                 map[robot[1]][robot[0]] = chr(ord('A') + i)
             else:
@@ -138,6 +233,822 @@ class SokobanState(StateSpace):
         print(self.state_string())
 
 
+class SokobanKey:
+    '''
+    The hashable_state() of a SokobanState. Hashes to the state's Zobrist hash (so
+    hashing is O(1) whatever the number of boxes) and is equal only to the key of a
+    state with the same robots and boxes.
+    '''
+
+    __slots__ = ('hash', 'robots', 'boxes')
+
+    def __init__(self, hash, robots, boxes):
+        self.hash = hash
+        self.robots = robots
+        self.boxes = boxes
+
+    def __hash__(self):
+        return self.hash
+
+    def __eq__(self, other):
+        if not isinstance(other, SokobanKey):
+            return NotImplemented
+        return (self.hash == other.hash and self.robots == other.robots
+                and self.boxes == other.boxes)
+
+    def __repr__(self):
+        return repr((self.robots, self.boxes))
+
+
+class SokobanMap:
+    '''
+    The static part of a Sokoban problem: the room's dimensions, the storage points and
+    the obstacles. A map is shared by all the states of a problem (and by all problems
+    played in the same room), use SokobanMap.get to obtain it.
+
+    Cells of the room are numbered y * width + x.
+    '''
+
+    _maps = dict()
+    #guards the tables that maps fill in lazily, so that searches in several
+    #threads can share a map (a class attribute, so maps can still be pickled)
+    _lock = threading.Lock()
+    #the number of box configurations whose regions are kept (see region)
+    REGION_CACHE_SIZE = 10000
+
+    @staticmethod
+    def get(width, height, storage, obstacles):
+        '''
+        @return: The (cached) map for the given room.
+        '''
+        key = (width, height, storage, obstacles)
+        m = SokobanMap._maps.get(key)
+        if m is None:
+            m = SokobanMap(width, height, storage, obstacles)
+            SokobanMap._maps[key] = m
+        return m
+
+    def __init__(self, width, height, storage, obstacles):
+        '''
+        Creates a new Sokoban map.
+        @param width: The room's X dimension (excluding walls).
+        @param height: The room's Y dimension (excluding walls).
+        @param storage: A frozenset of all the storage points.
+        @param obstacles: A frozenset of all the impassable obstacles.
+        '''
+        self.width = width
+        self.height = height
+        self.storage = storage
+        self.obstacles = obstacles
+        self.cells = width * height
+        self.box_mask = (1 << self.cells) - 1
+        self.storage_bits = 0
+        for point in storage:
+            self.storage_bits |= 1 << self.cell(point)
+        #the storage points' cells, the columns of the distance tables
+        self.storage_cells = tuple(sorted(self.cell(point) for point in storage))
+        self._push_distances = None
+        self._manhattan_distances = None
+        self.push_rows = None
+        self.manhattan_rows = None
+        self._dead_squares = None
+        self.pattern_databases = dict()
+        #regions[boxes][c] is the smallest cell of the region of c around the
+        #boxes, for the regions flood filled so far (see region)
+        self.regions = dict()
+        #robots are stored as cell + 1 so that an empty field ends the list
+        self.robot_bits = self.cells.bit_length()
+        self.robot_mask = (1 << self.robot_bits) - 1
+        #moves[d][c] is the cell reached by moving from cell c in direction
+        #DIRECTIONS[d], or -1 if that is a wall or an obstacle
+        self.moves = tuple(tuple(self._move(c, direction) for c in range(self.cells))
+                           for direction in DIRECTIONS)
+        self.actions = []
+        #Zobrist keys: a random 64 bit number for a box in each cell and, per
+        #robot, for that robot in each cell. Seeded so that every process
+        #computes the same hashes.
+        rng = random.Random(0)
+        self.zobrist_boxes = tuple(rng.getrandbits(64) for c in range(self.cells))
+        self.zobrist_robots = []
+
+    def _move(self, c, direction):
+        x, y = direction.move(self.location(c))
+        if x < 0 or x >= self.width or y < 0 or y >= self.height or (x, y) in self.obstacles:
+            return -1
+        return self.cell((x, y))
+
+    def cell(self, location):
+        '''
+        @return: The number of the cell at location (x, y).
+        '''
+        return location[1] * self.width + location[0]
+
+    def location(self, cell):
+        '''
+        @return: The location (x, y) of the numbered cell.
+        '''
+        return (cell % self.width, cell // self.width)
+
+    def fingerprint(self):
+        '''
+        @return: A digest (hexadecimal string) of the room, the same in every run.
+        '''
+        room = repr((self.width, self.height, sorted(self.storage), sorted(self.obstacles)))
+        return hashlib.sha1(room.encode()).hexdigest()
+
+    def pattern_database(self, size, directory):
+        '''
+        @return: The (cached) SokobanPatternDatabase of the map for patterns of size boxes,
+                 with its files in directory.
+        '''
+        key = (size, directory)
+        database = self.pattern_databases.get(key)
+        if database is None:
+            database = self.pattern_databases[key] = SokobanPatternDatabase(self, size, directory)
+        return database
+
+    def push_distances(self):
+        '''
+        @return: A NumPy array of the number of pushes needed to move a box from each cell (row)
+                 to each storage point (column, in the order of storage_cells) in the otherwise
+                 empty room, np.inf where that is impossible. Computed once per map, by a
+                 breadth first search from each storage point that pulls the box backwards.
+        '''
+        if self._push_distances is None:
+            table = np.full((self.cells, len(self.storage_cells)), np.inf)
+            for column, target in enumerate(self.storage_cells):
+                table[target, column] = 0
+                queue = deque([target])
+                while queue:
+                    c = queue.popleft()
+                    for moves in self.moves:
+                        #the box came from the next cell in this direction,
+                        #pushed by a robot standing on the cell after that
+                        previous = moves[c]
+                        if previous < 0 or moves[previous] < 0 or table[previous, column] != np.inf:
+                            continue
+                        table[previous, column] = table[c, column] + 1
+                        queue.append(previous)
+            self._push_distances = table
+            #the rows as lists, for looking up a few entries at a time
+            self.push_rows = table.tolist()
+        return self._push_distances
+
+    def dead_squares(self):
+        '''
+        @return: A bitset (int) of the cells from which a box can never be pushed to any
+                 storage point, even in the otherwise empty room. Computed once per map, by
+                 a breadth first search from all the storage points that pulls boxes
+                 backwards.
+        '''
+        if self._dead_squares is None:
+            live = set(self.storage_cells)
+            queue = deque(live)
+            while queue:
+                c = queue.popleft()
+                for moves in self.moves:
+                    previous = moves[c]
+                    if previous < 0 or moves[previous] < 0 or previous in live:
+                        continue
+                    live.add(previous)
+                    queue.append(previous)
+            self._dead_squares = 0
+            for c in range(self.cells):
+                if c not in live:
+                    self._dead_squares |= 1 << c
+        return self._dead_squares
+
+    def region(self, boxes, cell):
+        '''
+        @return: The smallest cell of the region that can be walked to from cell around the
+                 given boxes (a frozenset), ignoring robots. Regions are found by flood fill,
+                 once per box configuration; the last REGION_CACHE_SIZE configurations are
+                 kept.
+        '''
+        with SokobanMap._lock:
+            regions = self.regions.get(boxes)
+            smallest = None if regions is None else regions.get(cell)
+        if smallest is not None:
+            return smallest
+
+        blocked = {self.cell(box) for box in boxes}
+        region = [cell]
+        reached = {cell}
+        queue = deque(region)
+        while queue:
+            c = queue.popleft()
+            for moves in self.moves:
+                next_cell = moves[c]
+                if next_cell < 0 or next_cell in blocked or next_cell in reached:
+                    continue
+                reached.add(next_cell)
+                region.append(next_cell)
+                queue.append(next_cell)
+        smallest = min(region)
+
+        #the cache is shared by the searches of all threads
+        with SokobanMap._lock:
+            regions = self.regions.get(boxes)
+            if regions is None:
+                if len(self.regions) >= SokobanMap.REGION_CACHE_SIZE:
+                    del self.regions[next(iter(self.regions))]
+                regions = self.regions[boxes] = dict()
+            for c in region:
+                regions[c] = smallest
+        return smallest
+
+    def manhattan_distances(self):
+        '''
+        @return: A NumPy array of the Manhattan distances from each cell (row) to each storage
+                 point (column, in the order of storage_cells). Computed once per map.
+        '''
+        if self._manhattan_distances is None:
+            cells = np.arange(self.cells)
+            targets = np.array(self.storage_cells, dtype=int)
+            self._manhattan_distances = (
+                np.abs((cells % self.width)[:, None] - (targets % self.width)[None, :]) +
+                np.abs((cells // self.width)[:, None] - (targets // self.width)[None, :]))
+            self.manhattan_rows = self._manhattan_distances.tolist()
+        return self._manhattan_distances
+
+    def zobrist_robot(self, robot):
+        '''
+        @return: The Zobrist keys of robot for each cell.
+        '''
+        if robot < len(self.zobrist_robots):
+            return self.zobrist_robots[robot]
+        with SokobanMap._lock:
+            while len(self.zobrist_robots) <= robot:
+                rng = random.Random(len(self.zobrist_robots) + 1)
+                self.zobrist_robots.append(tuple(rng.getrandbits(64) for c in range(self.cells)))
+            return self.zobrist_robots[robot]
+
+    def zobrist(self, robots, boxes):
+        '''
+        @return: The Zobrist hash of the given robots (tuple) and boxes (frozenset).
+        '''
+        h = 0
+        for box in boxes:
+            h ^= self.zobrist_boxes[self.cell(box)]
+        for robot, location in enumerate(robots):
+            h ^= self.zobrist_robot(robot)[self.cell(location)]
+        return h
+
+    def robot_actions(self, robot):
+        '''
+        @return: The action names of robot for each direction (shared between states).
+        '''
+        if robot < len(self.actions):
+            return self.actions[robot]
+        with SokobanMap._lock:
+            while len(self.actions) <= robot:
+                self.actions.append(tuple(str(len(self.actions)) + " " + direction.name
+                                          for direction in DIRECTIONS))
+            return self.actions[robot]
+
+    def pack(self, robots, boxes):
+        '''
+        @return: The integer encoding of the given robots (tuple) and boxes (frozenset).
+        '''
+        code = 0
+        for box in boxes:
+            code |= 1 << self.cell(box)
+        shift = self.cells
+        for robot in robots:
+            code |= (self.cell(robot) + 1) << shift
+            shift += self.robot_bits
+        return code
+
+    def robot_cells(self, code):
+        '''
+        @return: A list of the cells of the robots in the packed state code.
+        '''
+        cells = []
+        robots = code >> self.cells
+        while robots:
+            cells.append((robots & self.robot_mask) - 1)
+            robots >>= self.robot_bits
+        return cells
+
+    def box_cells(self, code):
+        '''
+        @return: A list of the cells of the boxes in the packed state code.
+        '''
+        cells = []
+        boxes = code & self.box_mask
+        while boxes:
+            low = boxes & -boxes
+            cells.append(low.bit_length() - 1)
+            boxes ^= low
+        return cells
+
+
+class SokobanPatternDatabase:
+    '''
+    A pattern database for the boxes of a SokobanMap: for every set of size boxes (a
+    pattern) it holds the number of pushes needed to move them onto different storage
+    points in the room without the other boxes, if a robot could always be on any free
+    cell it needs to push from. Where the robots really are doesn't matter, so this is a
+    lower bound whatever the number of robots. A push moves a single box, so the values
+    of disjoint patterns add up to a lower bound of the pushes (and so of the moves)
+    needed to store all the boxes.
+
+    The values for patterns of each size are found once per map by a breadth first
+    search from the goals that pulls the boxes backwards, and saved in directory as a
+    NumPy file named after the map's fingerprint, which later runs (and other
+    processes) memory map instead of searching again. Use SokobanMap.pattern_database
+    to obtain the database of a map.
+    '''
+
+    #the value of the patterns that can't be stored
+    UNREACHABLE = np.iinfo(np.uint16).max
+    #part of the file names, changed whenever the values of the tables change
+    VERSION = 2
+
+    def __init__(self, map, size, directory):
+        '''
+        Creates the pattern database of a map (the tables are loaded or built when first used).
+        @param map: The SokobanMap of the room.
+        @param size: The number of boxes in a pattern.
+        @param directory: The directory of the database files.
+        '''
+        self.map = map
+        self.size = size
+        self.directory = directory
+        #tables[k] holds the values of the patterns of k boxes, at the index
+        #of their cells in the combinatorial number system (see index)
+        self.tables = [None] * (size + 1)
+        self.binomials = [[math.comb(c, k) for c in range(map.cells)] for k in range(size + 1)]
+
+    def path(self, size):
+        '''
+        @return: The file name of the table of the patterns of size boxes.
+        '''
+        return os.path.join(self.directory, "{}-{}-v{}.npy".format(
+            self.map.fingerprint(), size, SokobanPatternDatabase.VERSION))
+
+    def index(self, cells):
+        '''
+        @return: The index in the tables of the pattern of the given (sorted) cells.
+        '''
+        binomials = self.binomials
+        return sum(binomials[k + 1][c] for k, c in enumerate(cells))
+
+    def table(self, size):
+        '''
+        @return: The (read only) table of the patterns of size boxes, loaded from its file, or
+                 built and saved if there is none.
+        '''
+        if self.tables[size] is None:
+            path = self.path(size)
+            if not os.path.exists(path):
+                os.makedirs(self.directory, exist_ok=True)
+                #written under another name first, so that a process never
+                #memory maps a file that another one is still writing
+                temporary = "{}.{}.npy".format(path[:-len(".npy")], os.getpid())
+                np.save(temporary, self.build(size))
+                os.replace(temporary, path)
+            self.tables[size] = np.load(path, mmap_mode='r')
+        return self.tables[size]
+
+    def build(self, size):
+        '''
+        @return: The table of the patterns of size boxes, computed by a breadth first search from
+                 the patterns on storage points in which each pull costs one.
+        '''
+        m = self.map
+        moves = m.moves
+        table = np.full(math.comb(m.cells, size), SokobanPatternDatabase.UNREACHABLE, dtype=np.uint16)
+
+        layer = list(itertools.combinations(m.storage_cells, size))
+        for pattern in layer:
+            table[self.index(pattern)] = 0
+
+        pulls = 0
+        while layer:
+            pulls += 1
+            next_layer = []
+            for pattern in layer:
+                for box in pattern:
+                    for direction in range(4):
+                        #a robot next to the box steps back pulling the box
+                        #onto its cell
+                        robot = moves[direction][box]
+                        if robot < 0 or robot in pattern:
+                            continue
+                        new_robot = moves[direction][robot]
+                        if new_robot < 0 or new_robot in pattern:
+                            continue
+                        new_pattern = tuple(sorted(robot if c == box else c for c in pattern))
+                        i = self.index(new_pattern)
+                        if table[i] != SokobanPatternDatabase.UNREACHABLE:
+                            continue
+                        table[i] = pulls
+                        next_layer.append(new_pattern)
+            layer = next_layer
+        return table
+
+    def lookup(self, boxes):
+        '''
+        @return: The sum of the values of the patterns made of the given boxes (a frozenset),
+                 taken size at a time in the order of their cells, or inf if one of the
+                 patterns can't be stored.
+        '''
+        m = self.map
+        cells = sorted(m.cell(box) for box in boxes)
+        total = 0
+        for i in range(0, len(cells), self.size):
+            pattern = cells[i:i + self.size]
+            value = self.table(len(pattern))[self.index(pattern)]
+            if value == SokobanPatternDatabase.UNREACHABLE:
+                return math.inf
+            total += int(value)
+        return total
+
+
+class PackedSokobanState(StateSpace):
+    '''
+    A Sokoban state whose robots and boxes are packed into a single integer code: bit c
+    of the code is set if there is a box in cell c, and above the box bits each robot
+    occupies a field of map.robot_bits bits holding its cell + 1. The room itself is a
+    shared SokobanMap.
+
+    Hashing and comparing states is a single integer operation, and the robots, boxes,
+    storage, obstacles, width and height attributes of SokobanState are available (as
+    read-only properties) so heuristics written for SokobanState work unchanged.
+    '''
+
+    __slots__ = ('map', 'code')
+
+    def __init__(self, action, gval, parent, map, code):
+        '''
+        Creates a new packed Sokoban state.
+        @param map: The SokobanMap of the room.
+        @param code: The integer encoding of the robots and boxes (see SokobanMap.pack).
+        '''
+        StateSpace.__init__(self, action, gval, parent)
+        self.map = map
+        self.code = code
+
+    @staticmethod
+    def from_state(state):
+        '''
+        @return: A packed copy of the given SokobanState (with no parent).
+        '''
+        m = SokobanMap.get(state.width, state.height, state.storage, state.obstacles)
+        return PackedSokobanState(state.action, state.gval, None, m, m.pack(state.robots, state.boxes))
+
+    def to_state(self):
+        '''
+        @return: An unpacked SokobanState copy of this state (with no parent).
+        '''
+        return SokobanState(self.action, self.gval, None, self.map.width, self.map.height,
+                            self.robots, self.boxes, self.map.storage, self.map.obstacles)
+
+    @property
+    def width(self):
+        return self.map.width
+
+    @property
+    def height(self):
+        return self.map.height
+
+    @property
+    def storage(self):
+        return self.map.storage
+
+    @property
+    def obstacles(self):
+        return self.map.obstacles
+
+    @property
+    def robots(self):
+        return tuple(self.map.location(c) for c in self.map.robot_cells(self.code))
+
+    @property
+    def boxes(self):
+        return frozenset(self.map.location(c) for c in self.map.box_cells(self.code))
+
+    def successors(self):
+        '''
+        Generates all the actions that can be performed from this state, and the states those actions will create.
+        Pushes of a box onto a dead square (see SokobanMap.dead_squares) are left out.
+        '''
+        successors = []
+        transition_cost = 1
+        m = self.map
+        moves = m.moves
+        code = self.code
+        gval = self.gval + transition_cost
+        robots = m.robot_cells(code)
+        dead_squares = m.dead_squares()
+        shift = m.cells
+
+        for robot, location in enumerate(robots):
+            actions = m.robot_actions(robot)
+            for direction in range(4):
+                new_location = moves[direction][location]
+                if new_location < 0 or new_location in robots:
+                    continue
+
+                new_code = code
+                if code >> new_location & 1:
+                    new_box_location = moves[direction][new_location]
+                    if (new_box_location < 0 or new_box_location in robots or code >> new_box_location & 1 or
+                            dead_squares >> new_box_location & 1):
+                        continue
+                    new_code ^= (1 << new_location) | (1 << new_box_location)
+
+                new_code ^= ((location + 1) ^ (new_location + 1)) << shift
+                successors.append(PackedSokobanState(actions[direction], gval, self, m, new_code))
+            shift += m.robot_bits
+
+        return successors
+
+    def hashable_state(self):
+        '''Return a data item that can be used as a dictionary key to UNIQUELY represent a state.'''
+        return self.code
+
+    state_string = SokobanState.state_string
+
+    print_state = SokobanState.print_state
+
+
+class SokobanPushState(SokobanState):
+    '''
+    A SokobanState whose successors are box pushes rather than single robot moves: for
+    each robot, the cells it can walk to (around the boxes and the other robots) are
+    found by one breadth first search, and each push of a box from such a cell is a
+    successor. The walk costs one per move like the moves themselves, so the gval of a
+    state is the number of single moves that reach it. With several robots, a robot
+    may have to step aside for another, so the single moves of each robot that don't
+    push a box are successors too. Searches find solutions of the same (optimal) cost
+    as with SokobanState, but with several robots those moves make many pushes
+    reachable in more than one way, so push level search pays off mostly with one.
+
+    The action of a state is its push (or single move) and walk holds the moves of the
+    walk before it; print_path shows both.
+
+    In canonical mode, hashable_state() replaces the robot's location by the smallest
+    cell of the region it can walk to around the boxes (see SokobanMap.region), so that
+    states with the same boxes and the robot in the same region are one state for the
+    closed list. This shrinks the explored state space a lot, but the walk to a push
+    depends on where in its region the robot is, so the solutions found no longer have
+    optimal cost (they are still valid). Only states with one robot are canonicalized:
+    robots other than the one pushing stay where they are, so with several robots the
+    cell of each one matters.
+    '''
+
+    def __init__(self, action, gval, parent, width, height, robots, boxes, storage, obstacles, walk=(),
+                 canonical=False):
+        '''
+        Creates a new push level Sokoban state, with the same parameters as a SokobanState.
+        @param walk: The action names of the robot moves made before the push (action).
+        @param canonical: Whether to use canonical keys (inherited by the successors).
+        '''
+        SokobanState.__init__(self, action, gval, parent, width, height, robots, boxes, storage, obstacles)
+        self.walk = walk
+        self.canonical = canonical
+
+    @staticmethod
+    def from_state(state, canonical=False):
+        '''
+        @return: A push level copy of the given SokobanState (with no parent).
+        '''
+        return SokobanPushState(state.action, state.gval, None, state.width, state.height,
+                                state.robots, state.boxes, state.storage, state.obstacles,
+                                canonical=canonical)
+
+    def successors(self):
+        '''
+        Generates all the box pushes that can be performed from this state, and the states
+        those pushes (and the robot walks before them) will create, as well as the single
+        moves of the robots if there are several. Pushes of a box onto a dead square (see
+        SokobanMap.dead_squares) are left out.
+        '''
+        successors = []
+        m = SokobanMap.get(self.width, self.height, self.storage, self.obstacles)
+        moves = m.moves
+        dead_squares = m.dead_squares()
+        zobrist = self.zobrist_hash(m)
+        zobrist_boxes = m.zobrist_boxes
+        cells = self.box_cells(m)
+        box_cells = set(cells)
+        robot_cells = [m.cell(robot) for robot in self.robots]
+
+        for robot, start in enumerate(robot_cells):
+            actions = m.robot_actions(robot)
+            zobrist_robot = m.zobrist_robot(robot)
+            #the robot walks around the boxes and the other robots, and pushes
+            #boxes onto any cell but those (including the one it started from)
+            others = set(robot_cells[:robot] + robot_cells[robot + 1:])
+            blocked = box_cells.union(robot_cells)
+            push_blocked = box_cells.union(others)
+            if others:
+                #the moves that let the robot out of the way of the others
+                for direction in range(4):
+                    next_cell = moves[direction][start]
+                    if next_cell < 0 or next_cell in blocked:
+                        continue
+                    new_robots = list(self.robots)
+                    new_robots[robot] = m.location(next_cell)
+                    new_state = SokobanPushState(actions[direction], self.gval + 1, self,
+                                                 self.width, self.height, tuple(new_robots), self.boxes,
+                                                 self.storage, self.obstacles, (), self.canonical)
+                    new_state.zobrist = zobrist ^ zobrist_robot[start] ^ zobrist_robot[next_cell]
+                    new_state.cells = cells
+                    successors.append(new_state)
+            #breadth first search of the cells the robot can walk to, each
+            #with the (cell, direction) it was first reached from
+            reached = {start: None}
+            distance = {start: 0}
+            queue = deque([start])
+            while queue:
+                c = queue.popleft()
+                for direction in range(4):
+                    next_cell = moves[direction][c]
+                    if next_cell < 0:
+                        continue
+                    if next_cell in box_cells:
+                        #push the box from c
+                        new_box = moves[direction][next_cell]
+                        if new_box < 0 or new_box in push_blocked or dead_squares >> new_box & 1:
+                            continue
+                        walk = []
+                        cell = c
+                        while reached[cell] is not None:
+                            cell, step = reached[cell]
+                            walk.append(actions[step])
+                        walk.reverse()
+                        new_robots = list(self.robots)
+                        new_robots[robot] = m.location(next_cell)
+                        new_boxes = set(self.boxes)
+                        new_boxes.remove(m.location(next_cell))
+                        new_boxes.add(m.location(new_box))
+                        new_state = SokobanPushState(actions[direction], self.gval + distance[c] + 1, self,
+                                                     self.width, self.height, tuple(new_robots), frozenset(new_boxes),
+                                                     self.storage, self.obstacles, tuple(walk), self.canonical)
+                        new_state.zobrist = (zobrist ^ zobrist_robot[start] ^ zobrist_robot[next_cell]
+                                             ^ zobrist_boxes[next_cell] ^ zobrist_boxes[new_box])
+                        new_cells = list(cells)
+                        new_cells[new_cells.index(next_cell)] = new_box
+                        new_state.cells = tuple(new_cells)
+                        successors.append(new_state)
+                    elif next_cell not in blocked and next_cell not in reached:
+                        reached[next_cell] = (c, direction)
+                        distance[next_cell] = distance[c] + 1
+                        queue.append(next_cell)
+
+        return successors
+
+    def hashable_state(self):
+        '''Return a data item that can be used as a dictionary key to represent a state (in
+           canonical mode, the same item for all the states with the same boxes and robot
+           region).'''
+        if self.key is None:
+            if not self.canonical or len(self.robots) != 1:
+                return SokobanState.hashable_state(self)
+            m = SokobanMap.get(self.width, self.height, self.storage, self.obstacles)
+            zobrist = self.zobrist_hash(m)
+            (location,) = self.robots
+            cell = m.cell(location)
+            region = m.region(self.boxes, cell)
+            zobrist_robot = m.zobrist_robot(0)
+            zobrist ^= zobrist_robot[cell] ^ zobrist_robot[region]
+            self.key = SokobanKey(zobrist, (region,), self.boxes)
+        return self.key
+
+    def heuristic_key(self):
+        '''Return the key of the state's heuristic value in a HeuristicCache: the exact key,
+           with the robot's location, even in canonical mode (heuristics such as
+           heur_alternate depend on where the robot is).'''
+        if not self.canonical or len(self.robots) != 1:
+            return self.hashable_state()
+        return SokobanKey(self.zobrist_hash(), self.robots, self.boxes)
+
+    def print_state(self):
+        '''
+        Prints the walk and push that led to the state and its string representation.
+        '''
+        if self.walk:
+            print("WALK was " + ", ".join(self.walk))
+        SokobanState.print_state(self)
+
+
+class SokobanRegressionState(StateSpace):
+    '''
+    A state of a backward (regression) search from the goal, used by bidirectional
+    search. It describes the boxes and robots some number of moves (its gval) before a
+    goal is reached. A robot's location is None if the robot makes no more moves
+    before the goal: it then stays wherever it is, which the backward search leaves
+    open.
+
+    successors() returns the predecessors of the state: the states from which a single
+    robot move leads to it. The action of a predecessor is the name of that move, so
+    following parents from a regression state lists the moves that reach the goal.
+    '''
+
+    def __init__(self, action, gval, parent, width, height, robots, boxes, storage, obstacles):
+        '''
+        Creates a new regression state, with the same parameters as a SokobanState
+        except that robots may contain None for robots that make no more moves.
+        '''
+        StateSpace.__init__(self, action, gval, parent)
+        self.width = width
+        self.height = height
+        self.robots = robots
+        self.boxes = boxes
+        self.storage = storage
+        self.obstacles = obstacles
+
+    def _free(self, location):
+        return (0 <= location[0] < self.width and 0 <= location[1] < self.height
+                and location not in self.obstacles and location not in self.boxes
+                and location not in self.robots)
+
+    def successors(self):
+        '''
+        Generates the predecessors of this state (see the class description).
+        '''
+        predecessors = []
+        transition_cost = 1
+
+        for robot in range(0, len(self.robots)):
+          location = self.robots[robot]
+          for direction in (UP, RIGHT, DOWN, LEFT):
+              back = (-direction.delta[0], -direction.delta[1])
+              action = str(robot) + " " + direction.name
+
+              if location is None:
+                  #The robot's last move: in an optimal plan that is a push (any
+                  #later plain move would be wasted), so the robot is placed
+                  #next to a box it has just pushed.
+                  for box in self.boxes:
+                      pusher = (box[0] + back[0], box[1] + back[1])
+                      start = (pusher[0] + back[0], pusher[1] + back[1])
+                      if not self._free(pusher) or not self._free(start):
+                          continue
+                      new_robots = self.robots[:robot] + (start,) + self.robots[robot + 1:]
+                      new_boxes = (self.boxes - {box}) | {pusher}
+                      predecessors.append(SokobanRegressionState(action, self.gval + transition_cost, self, self.width, self.height, new_robots, new_boxes, self.storage, self.obstacles))
+                  continue
+
+              start = (location[0] + back[0], location[1] + back[1])
+              if not self._free(start):
+                  continue
+              new_robots = self.robots[:robot] + (start,) + self.robots[robot + 1:]
+
+              #a plain move from start to location
+              predecessors.append(SokobanRegressionState(action, self.gval + transition_cost, self, self.width, self.height, new_robots, self.boxes, self.storage, self.obstacles))
+
+              #a push from start, if there is a box beyond location
+              box = direction.move(location)
+              if box in self.boxes:
+                  new_boxes = (self.boxes - {box}) | {location}
+                  predecessors.append(SokobanRegressionState(action, self.gval + transition_cost, self, self.width, self.height, new_robots, new_boxes, self.storage, self.obstacles))
+
+        return predecessors
+
+    def hashable_state(self):
+        '''Return a data item that can be used as a dictionary key to UNIQUELY represent a state.'''
+        return (self.robots, self.boxes)
+
+    state_string = SokobanState.state_string
+
+    print_state = SokobanState.print_state
+
+
+def sokoban_regression_goals(state):
+  '''Returns the states a backward search for the goal of state starts from'''
+  '''INPUT: a sokoban state'''
+  '''OUTPUT: a list of regression states, one per way of placing the boxes on storage points'''
+  robots = (None,) * len(state.robots)
+  return [SokobanRegressionState("GOAL", 0, None, state.width, state.height, robots, frozenset(boxes), state.storage, state.obstacles)
+          for boxes in itertools.combinations(sorted(state.storage), len(state.boxes))]
+
+def sokoban_meet_key(state):
+  '''Returns the key under which bidirectional search looks for meeting states: the boxes'''
+  return state.boxes
+
+def sokoban_join(forward, backward):
+  '''Joins a state of the forward search to a regression state of the backward search'''
+  '''INPUT: a sokoban state and a regression state'''
+  '''OUTPUT: the goal state reached by making backward's moves from forward, or None if they do not meet'''
+  if forward.boxes != backward.boxes:
+    return None
+  for robot, location in enumerate(backward.robots):
+    if location is not None and forward.robots[robot] != location:
+      return None
+  #replay the moves: a robot left open by the backward search could be in
+  #the way of another robot's or a box's move
+  state = forward
+  while backward.parent:
+    state = next((succ for succ in state.successors() if succ.action == backward.action), None)
+    backward = backward.parent
+    if state is None or state.boxes != backward.boxes:
+      return None
+  return state
+
 def sokoban_goal_state(state):
   '''Returns True if we have reached a goal state'''
   '''INPUT: a sokoban state'''
@@ -147,6 +1058,12 @@ def sokoban_goal_state(state):
       return False
   return True
 
+def packed_sokoban_goal_state(state):
+  '''Returns True if we have reached a goal state'''
+  '''INPUT: a packed sokoban state'''
+  '''OUTPUT: True (if goal) or False (if not)'''
+  return state.code & state.map.box_mask & ~state.map.storage_bits == 0
+
 '''
 Sokoban Problem Set, for testing
 '''
@@ -321,6 +1238,9 @@ RIGHT = Direction("right", (1, 0))
 DOWN = Direction("down", (0, 1))
 LEFT = Direction("left", (-1, 0))
 
+#Directions in the order robots try them when generating successors
+DIRECTIONS = (UP, RIGHT, DOWN, LEFT)
+
 
 
   
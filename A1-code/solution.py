@@ -11,6 +11,7 @@ import numpy as np
 from search import *  # for search engines
 # for Sokoban specific classes and problems
 from sokoban import SokobanState, Direction, PROBLEMS
+from sokoban import SokobanMap
 import math
 import csv
 
@@ -26,13 +27,13 @@ def sokoban_goal_state(state):
 
 
 def find_manhattan_distance(source, destination):
-     '''
+      '''
       @param source: tuple (x1, y1) representing the position of the start point
       @param destination: tuple (x2, y2) representing the position of the end point
 
       manhattan distance = abs(x2 - x1) + abs(y2 - y1)
       '''
-      return math.fabs(destination[0] - source[0]) + math.fabs(destination[1] - source[1])
+      return abs(destination[0] - source[0]) + abs(destination[1] - source[1])
 
 
 def heur_manhattan_distance(state):
@@ -54,23 +55,103 @@ def heur_manhattan_distance(state):
                   in this case, state, is to the goal where all boxes are in a storage spot
     '''
 
-    manhattan_dist = 0.0
-    storage_distances = list()
+    # the distances from every cell to every storage site are computed once per map
+    room = SokobanMap.get(state.width, state.height, state.storage, state.obstacles)
+    if room.manhattan_rows is None:
+      room.manhattan_distances()
+    rows = room.manhattan_rows
 
-    # for each box in the game state, find the closest storage site
-    for box in state.boxes:
-      for storage in state.storage:
-        # add each distance from a box to a storage site to a list
-        storage_distances.append(find_manhattan_distance(box, storage))
+    # for each box in the game state, add the distance to the closest storage site
+    return float(sum(min(rows[room.cell(box)]) for box in state.boxes))
 
-      # add the minimum distance
-      manhattan_dist += min(storage_distances)
-      # clear the list to contain new distances of another box from storage sites
-      storage_distances.clear()
+#SOKOBAN HEURISTICS
 
-    return manhattan_dist
 
-#SOKOBAN HEURISTICS
+def box_cells_array(room, states):
+  '''The cells of the boxes of states, packed into one array'''
+  '''INPUT: the SokobanMap of the states and a non-empty list of sokoban states (with the same number of boxes)'''
+  '''OUTPUT: an integer array with a row per state and a column per box'''
+  # the states carry their box cells (see SokobanState.box_cells), so NumPy
+  # only has to stack tuples of ints
+  return np.array([state.box_cells(room) for state in states], dtype=int).reshape(len(states), -1)
+
+
+# distance from each cell to the nearest storage spot, as Manhattan distance
+# and as number of pushes, keyed by map
+nearest_storage = dict()
+
+
+def nearest_storage_distances(room):
+  '''The distances from each cell of room to its nearest storage spot'''
+  '''INPUT: a SokobanMap'''
+  '''OUTPUT: a pair of arrays (Manhattan distances, pushes), indexed by cell'''
+  distances = nearest_storage.get(room)
+  if distances is None:
+    distances = (room.manhattan_distances().min(axis=1), room.push_distances().min(axis=1))
+    nearest_storage[room] = distances
+  return distances
+
+
+# the same distances as Python lists, with the pushes from each cell to each
+# storage spot, for batches too small to pay for NumPy's overhead per call
+nearest_storage_lists = dict()
+
+# batches with fewer box cells than this are evaluated in plain Python
+BATCH_MIN_CELLS = 64
+
+
+def nearest_storage_distance_lists(room):
+  '''The distances from each cell of room to its nearest storage spot, as lists'''
+  '''INPUT: a SokobanMap'''
+  '''OUTPUT: a triple of lists (Manhattan distances, pushes, pushes to each spot), indexed by cell'''
+  distances = nearest_storage_lists.get(room)
+  if distances is None:
+    manhattan, pushes = nearest_storage_distances(room)
+    distances = (manhattan.tolist(), pushes.tolist(), room.push_distances().tolist())
+    nearest_storage_lists[room] = distances
+  return distances
+
+
+def heur_manhattan_distance_batch(states):
+  '''heur_manhattan_distance of many states at once, for SearchEngine.init_search's heur_batch_fn'''
+  '''INPUT: a non-empty list of sokoban states of the same problem'''
+  '''OUTPUT: a sequence (a NumPy array for large batches) of the estimates of the distances of the states to the goal'''
+  state = states[0]
+  room = SokobanMap.get(state.width, state.height, state.storage, state.obstacles)
+  if len(states) * len(state.boxes) < BATCH_MIN_CELLS:
+    manhattan = nearest_storage_distance_lists(room)[0]
+    return [float(sum([manhattan[c] for c in state.box_cells(room)])) for state in states]
+  manhattan = nearest_storage_distances(room)[0]
+  return manhattan[box_cells_array(room, states)].sum(axis=1).astype(float)
+
+
+def heur_matching_batch(states):
+  '''admissible sokoban heuristic for many states at once: a lower bound of the pushes of the
+     minimum cost assignment of the boxes to storage spots (see box_storage_matching)'''
+  '''INPUT: a non-empty list of sokoban states of the same problem'''
+  '''OUTPUT: a sequence (a NumPy array for large batches) of the estimates of the distances of the states to the goal'''
+  # every box needs at least the pushes to its nearest spot and, when there are as
+  # many boxes as spots, every spot needs at least the pushes of its nearest box
+  state = states[0]
+  room = SokobanMap.get(state.width, state.height, state.storage, state.obstacles)
+  full = len(state.boxes) == len(room.storage_cells)
+  if len(states) * len(state.boxes) < BATCH_MIN_CELLS:
+    nearest, pushes, push_rows = nearest_storage_distance_lists(room)
+    hvals = []
+    for state in states:
+      cells = state.box_cells(room)
+      hval = sum([pushes[c] for c in cells])
+      if full:
+        hval = max(hval, sum(map(min, zip(*[push_rows[c] for c in cells]))))
+      hvals.append(hval)
+    return hvals
+  cells = box_cells_array(room, states)
+  pushes = nearest_storage_distances(room)[1]
+  hvals = pushes[cells].sum(axis=1)
+  if full:
+    hvals = np.maximum(hvals, room.push_distances()[cells].min(axis=1).sum(axis=1))
+  return hvals
+
 
 
 def trivial_heuristic(state):
@@ -85,7 +166,7 @@ def trivial_heuristic(state):
 
 
 def check_corners_deadlocks(state, box, box_obs):
-     '''
+      '''
       This function checks if the box is in a corner or blocked by some other box or
       obstacle in the horizontal and vertical direction
       INPUT: box coordinates, corners, boxes and obstacles list
@@ -98,33 +179,6 @@ def check_corners_deadlocks(state, box, box_obs):
       return x_blocked and y_blocked
 
 
-def check_edge_deadlock(state, box, storage):
-     # left edge
-     if box[0] == 0:
-          spot_left_edge = any((True for spot in storage if spot[0] == 0))
-          if not spot_left_edge:
-            return True
-      # right edge
-      elif box[0] == state.width - 1:
-          spot_right_edge = any(
-              (True for spot in storage if spot[0] == state.width - 1))
-          if not spot_right_edge:
-            return True
-      # top edge
-      elif box[1] == 0:
-          spot_top_edge = any((True for spot in storage if spot[1] == 0))
-          if not spot_top_edge:
-            return True
-      # bottom edge
-      elif box[1] == state.height - 1:
-          spot_bottom_edge = any(
-              (True for spot in storage if spot[1] == state.height - 1))
-          if not spot_bottom_edge:
-            return True
-      else:
-        return False
-
-
 def heur_alternate(state):
   # #IMPLEMENT
     '''a better heuristic'''
@@ -138,26 +192,27 @@ def heur_alternate(state):
     boxes = set(state.boxes)
     storage = set(state.storage)
     obstacles = set(state.obstacles)
-    taken_storage = set()
 
-    # get all unstored unboxes and available storage
-    unstored_boxes, available_storage = {box for box in boxes if box not in storage}, [
-      spot for spot in storage if spot not in boxes]
+    # get all unstored unboxes
+    unstored_boxes = {box for box in boxes if box not in storage}
 
     all_boxes_obstables = obstacles.union(unstored_boxes)
+    room = SokobanMap.get(state.width, state.height, state.storage, state.obstacles)
+    dead_squares = room.dead_squares()
 
     for box in unstored_boxes:
 
-         # union of obstacles and remaining boxes as they can block the current box if next to it
-         boxes_obs = all_boxes_obstables - {box}
+          # DEADLOCK CHECK: if the box is on a square from which it can never
+          # reach a storage spot (e.g. in a corner, or on an edge without one)
+          if dead_squares >> room.cell(box) & 1:
+            return math.inf
+
+          # union of obstacles and remaining boxes as they can block the current box if next to it
+          boxes_obs = all_boxes_obstables - {box}
 
           # DEADLOCK CHECK: if the box is blocked in a corner or by some obstacle or other box
           if(check_corners_deadlocks(state, box, boxes_obs)):
             return math.inf
-
-          # DEADLOCK CHECK: if a box is at an edge but the spot isn't, then deadlock
-          if(check_edge_deadlock(state, box, storage)):
-            return math.inf
                     
           # ########### DEADLOCK 4: check if box is blocked by 2 other boxes or obstacles ###########
           # left and bottom
@@ -176,31 +231,24 @@ def heur_alternate(state):
           # elif (box[0] + 1, box[1]) in boxes_obs and (box[0], box[1] - 1) in boxes_obs:
           #     return math.inf
 
-    # calculate hval now that DEADLOCK checks are completed
-    for box in unstored_boxes:
-         # assume smallest distance between the current box and spot/robot is infinite so it finds the smalles
-         smallest_box_spot_dist = float('inf')
-          smallest_box_robot_dist = float('inf')
+    # pushes needed by each box in a minimum cost assignment of the boxes to
+    # storage spots
+    box_dists = box_storage_matching(state)
+    if box_dists is None:
+      # DEADLOCK CHECK: the boxes can't all be pushed to different spots
+      return math.inf
 
-          # optimal spot per iteration is always reset
-          optimal_spot = None
-
-          # iterate over all available storage
-          for spot in available_storage:
-               if spot not in taken_storage:
-                    dist = find_manhattan_distance(box, spot)
-                    if(dist < smallest_box_spot_dist):
-                        smallest_box_spot_dist = dist
-                        optimal_spot = spot
+    # calculate hval now that DEADLOCK checks are completed
+    for box, smallest_box_spot_dist in box_dists.items():
+          if smallest_box_spot_dist == 0:
+            continue
 
           # iterate over all the robots for the current box
+          smallest_box_robot_dist = float('inf')
           for robot in state.robots:
               smallest_box_robot_dist = min(
                 find_manhattan_distance(robot, box), smallest_box_robot_dist)
 
-          # the closest spot is now a taken by the current box
-          taken_storage.add(optimal_spot)
-
           # add to hval
           hval += (smallest_box_spot_dist + \
                    min(smallest_box_robot_dist, smallest_box_spot_dist)) - 1
@@ -208,6 +256,123 @@ def heur_alternate(state):
     return hval
 
 
+# cost standing in for an impossible push in the assignment cost matrices
+UNREACHABLE_COST = 1e6
+
+# minimum cost assignments found so far, keyed by (map, boxes)
+box_matchings = dict()
+MAX_BOX_MATCHINGS = 100000
+
+
+def hungarian_augment(cost, u, v, p, row):
+  '''One step of the Hungarian algorithm: assign row to a column, moving
+     the rows along a shortest augmenting path, and update the potentials
+     u (rows) and v (columns) so that u[i] + v[j] <= cost[i, j] still holds
+     with equality for every assigned pair'''
+  '''INPUT: square cost matrix, potentials, p[j] the row assigned to column j (or -1),
+     with an extra last entry in v and p for a dummy column'''
+  '''OUTPUT: None (u, v and p are updated)'''
+  m = cost.shape[1]
+  minv = np.full(m, np.inf)
+  way = np.zeros(m, dtype=int)
+  used = np.zeros(m + 1, dtype=bool)
+  p[m] = row
+  j0 = m
+  while True:
+      used[j0] = True
+      i0 = p[j0]
+      free = ~used[:m]
+
+      # shortest reduced cost from the rows reached so far to each free column
+      reduced = cost[i0] - u[i0] - v[:m]
+      better = free & (reduced < minv)
+      minv[better] = reduced[better]
+      way[better] = j0
+      j1 = int(np.argmin(np.where(free, minv, np.inf)))
+      delta = minv[j1]
+
+      used_columns = np.flatnonzero(used)
+      u[p[used_columns]] += delta
+      v[used_columns] -= delta
+      minv[free] -= delta
+      j0 = j1
+      if p[j0] < 0:
+        break
+
+  # augment along the path
+  while j0 != m:
+      j1 = way[j0]
+      p[j0] = p[j1]
+      j0 = j1
+
+
+def box_storage_matching(state):
+  '''Minimum cost assignment of the boxes to storage spots, cost being the
+     number of pushes (ignoring the other boxes)'''
+  '''INPUT: a sokoban state'''
+  '''OUTPUT: a dictionary of the pushes needed by each box in the assignment, or None if
+     the boxes can't all be pushed to different storage spots'''
+  room = SokobanMap.get(state.width, state.height, state.storage, state.obstacles)
+  key = (room, state.boxes)
+  matching = box_matchings.get(key)
+
+  if matching is None:
+      push_distances = room.push_distances()
+      parent = state.parent
+      parent_matching = None if parent is None else box_matchings.get((room, parent.boxes))
+
+      if parent_matching is not None and len(state.boxes - parent.boxes) == 1:
+          # only one box moved: replace its row of the cost matrix, unassign
+          # it, lower its potential to keep u + v <= cost, and assign it again
+          boxes, cost, u, v, p = parent_matching
+          moved, = state.boxes - parent.boxes
+          row = boxes.index(next(iter(parent.boxes - state.boxes)))
+          boxes = boxes[:row] + [moved] + boxes[row + 1:]
+          cost, u, v, p = cost.copy(), u.copy(), v.copy(), p.copy()
+          cost[row] = np.minimum(push_distances[room.cell(moved)], UNREACHABLE_COST)
+          p[np.flatnonzero(p[:-1] == row)] = -1
+          u[row] = np.min(cost[row] - v[:-1])
+          hungarian_augment(cost, u, v, p, row)
+      else:
+          # one row per box, plus rows of cost 0 for the spots left empty
+          boxes = list(state.boxes)
+          m = len(room.storage_cells)
+          cost = np.zeros((m, m))
+          cost[:len(boxes)] = np.minimum(push_distances[[room.cell(box) for box in boxes]], UNREACHABLE_COST)
+          u, v, p = np.zeros(m), np.zeros(m + 1), np.full(m + 1, -1)
+          for row in range(m):
+              hungarian_augment(cost, u, v, p, row)
+
+      matching = (boxes, cost, u, v, p)
+      if len(box_matchings) >= MAX_BOX_MATCHINGS:
+          box_matchings.clear()
+      box_matchings[key] = matching
+
+  boxes, cost, u, v, p = matching
+  columns = np.empty(len(cost), dtype=int)
+  columns[p[:-1]] = np.arange(len(cost))
+  dists = cost[np.arange(len(boxes)), columns[:len(boxes)]]
+  if dists.max(initial=0) >= UNREACHABLE_COST:
+      return None
+  return dict(zip(boxes, dists.tolist()))
+
+
+# pattern databases: the number of boxes in a pattern, and the directory
+# their tables are saved in (and loaded from by later runs)
+PDB_SIZE = 2
+PDB_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pdb')
+
+
+def heur_pattern_database(state):
+  '''admissible additive pattern database heuristic: the sum over groups of PDB_SIZE boxes
+     of a lower bound of the pushes needed to store each group on its own'''
+  '''INPUT: a sokoban state'''
+  '''OUTPUT: a numeric value that serves as an estimate of the distance of the state to the goal.'''
+  # the tables are built the first time a map is seen, and saved to disk
+  room = SokobanMap.get(state.width, state.height, state.storage, state.obstacles)
+  return float(room.pattern_database(PDB_SIZE, PDB_DIRECTORY).lookup(state.boxes))
+
+
 def heur_zero(state):
     '''Zero Heuristic can be used to make A* search perform uniform cost search'''
     return 0
@@ -307,16 +472,18 @@ def compare_weighted_astars():
 
         for i in range(0, 3):
             problem = PROBLEMS[i]
+            # the variants search the same states, so share their heuristic values
+            heur_cache = HeuristicCache(heur_manhattan_distance, 100000)
             for weight in [2, 3,4,5]:
                 for count, fn in enumerate(funcions_list):
-                     # create a search engine
-                     se = SearchEngine(strategy=strategy_list[count])
+                      # create a search engine
+                      se = SearchEngine(strategy=strategy_list[count])
 
                       # initialize the search
                       if strategy_list[count] == 'astar':
-                           se.init_search(initState = problem, goal_fn=sokoban_goal_state, heur_fn=heur_manhattan_distance, fval_function=lambda sN: fn(sN, 1))
+                           se.init_search(initState = problem, goal_fn=sokoban_goal_state, heur_fn=heur_cache, fval_function=lambda sN: fn(sN, 1))
                       else:
-                           se.init_search(initState = problem, goal_fn=sokoban_goal_state, heur_fn=heur_manhattan_distance, fval_function=lambda sN: fn(sN, weight))
+                           se.init_search(initState = problem, goal_fn=sokoban_goal_state, heur_fn=heur_cache, fval_function=lambda sN: fn(sN, weight))
 
                       # implement search for goal state
                       goal_state, stats = se.search(timebound=5)
@@ -331,6 +498,15 @@ def compare_weighted_astars():
                       csv_write.writerow(row)
 
 
+def weight_schedule(weight):
+  '''Decreasing weights for an anytime weighted A*: starting from weight,
+     each weight halves the distance of the previous one to 1, ending with 1'''
+  weights = [weight]
+  while weights[-1] > 1:
+    weights.append(1 + (weights[-1] - 1) / 2 if weights[-1] > 1.1 else 1)
+  return weights
+
+
 def anytime_weighted_astar(initial_state, heur_fn, weight=1., timebound= 10):
   #IMPLEMENT
   '''Provides an implementation of anytime weighted a-star, as described in the HW1 handout'''
@@ -338,38 +514,18 @@ def anytime_weighted_astar(initial_state, heur_fn, weight=1., timebound= 10):
   '''OUTPUT: A goal state (if a goal is found), else False'''
   '''implementation of weighted astar algorithm'''
 
-  weight = 8
-
-  # get the fval function
-  fval_funct = (lambda sN: fval_function_XUP(sN, weight))
-
   # instantiate a search engine
   search_eng = SearchEngine(strategy='custom', cc_level='full')
 
-  # initial costbound
-  costbound = (math.inf, math.inf, math.inf)
-
-  res = False
-
-  # start searching
-  start = os.times()[0]
-
   # get ready to search
-  search_eng.init_search(initial_state, sokoban_goal_state,
-                         heur_fn=heur_fn, fval_function=fval_funct)
-
-  # keep searching for optimal solutions until out of time
-  while(os.times()[0] - start <= timebound):
-
-       # do another search
-       goal_state, stats = search_eng.search(timebound=timebound - os.times()[0] + start, costbound=costbound)
+  search_eng.init_search(initial_state, sokoban_goal_state, heur_fn=heur_fn,
+                         fval_function=(lambda sN: fval_function(sN, weight)))
 
-        # check for a goal state
-        if(goal_state):
-             costbound = (goal_state.gval, math.inf, math.inf)
-              res = goal_state
-        else:
-          break
+  # ARA*: one weighted A* per weight, each one continuing the previous
+  # search, which yields every cheaper solution it finds until out of time
+  res = False
+  for goal_state, stats in search_eng.anytime_search(weight_schedule(max(weight, 1)), timebound=timebound):
+      res = goal_state
 
   return res
 
@@ -382,31 +538,29 @@ def anytime_gbfs(initial_state, heur_fn, timebound = 10):
   '''implementation of anytime greedy best-first search'''
 
   # instantiate a search engine
-  search_eng = SearchEngine(strategy='best_first', cc_level='full')
-
-  # initial costbound
-  costbound = (math.inf, math.inf, math.inf)
-
-  res = False
-
-  # start searching
-  start = os.times()[0]
+  search_eng = SearchEngine(strategy='custom', cc_level='full')
 
   # get ready to search
   search_eng.init_search(initial_state, sokoban_goal_state, heur_fn=heur_fn)
 
-  # keep searching for optimal solutions until out of time
-  while(os.times()[0] - start <= timebound):
+  # the first weighted A* has such a large weight that it orders OPEN by
+  # hval like best first search does, the ones after it improve the
+  # solution it finds without starting over
+  res = False
+  for goal_state, stats in search_eng.anytime_search(weight_schedule(1000), timebound=timebound):
+      res = goal_state
 
-      # do another search
-      goal_state, stats = search_eng.search(
-        timebound=timebound - os.times()[0] + start, costbound=costbound)
+  return res
 
-      # check for a goal state
-      if goal_state:
-           costbound = (goal_state.gval, math.inf, math.inf)
-            res = goal_state
-      else:
-           break
 
-  return res
+def multi_heuristic_astar(initial_state, timebound=10, weight=1.5, anchor_weight=2, schedule='round_robin'):
+  '''Multi-heuristic A*: heur_manhattan_distance bounds the cost of the solution while
+     heur_alternate, which is more informed but not admissible, guides the search'''
+  '''INPUT: a sokoban state that represents the start state and a timebound (number of seconds)'''
+  '''OUTPUT: A goal state of cost at most weight * anchor_weight times the optimal cost (if a goal is found), else False'''
+  search_eng = SearchEngine(strategy='mhastar')
+  search_eng.init_multi_heuristic_search(initial_state, sokoban_goal_state,
+                                         [heur_manhattan_distance, heur_alternate],
+                                         weight=weight, anchor_weight=anchor_weight, schedule=schedule)
+  goal_state, stats = search_eng.search(timebound)
+  return goal_state